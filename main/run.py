@@ -11,14 +11,18 @@ if sys.version_info < (3, 11):
     )
 
 import argparse
+import functools
 import os
 import sys
 import time
 
+import numpy as np
+
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.logger import logger
 from utils import cache as step_cache
+from utils import inventory
 from steps import step0, step1, step2, step3, step4, step5
 from utils.config import (GHCN_TEMP_URL, GHCN_META_URL, STRANGE_URL,
                           BRIGHTNESS_URL, SBBX_PATH, SBBX_INPUT_DIR,
@@ -30,6 +34,23 @@ def parse_args():
     parser.add_argument("--start_year", type=int, default=START_YEAR)
     parser.add_argument("--end_year", type=int, default=END_YEAR)
     parser.add_argument("--no-cache", action="store_true", help="Ignore cached step outputs")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for the parallel code paths")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Patch the cached step0 output from the previous GHCN release "
+                             "and refit only the step2 urban stations it affects")
+    parser.add_argument("--fuse-step1", action="store_true",
+                        help="Apply the step1 drop rules while step0 decodes "
+                             "(step0 output is not cached)")
+    parser.add_argument("--augmented-inv", metavar="PATH",
+                        help="Take global_light from a GISTEMP-augmented v4.inv "
+                             "instead of the brightness grid")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="Compute step2's annual anomalies in station blocks "
+                             "using about this much memory")
+    parser.add_argument("--extra-radii", type=float, nargs="+", default=[], metavar="KM",
+                        help="Also grid step 3 at these radii (e.g. 250) in the same pass; "
+                             "cached as step3_<KM>km")
     return parser.parse_args()
 
 
@@ -41,35 +62,87 @@ def main():
 
     sep = "-" * 25
 
+    # v4.inv is parsed (or loaded from its sidecar) once, by the first step
+    # that needs it, and shared by steps 0, 2 and 3.
+    inv = functools.cache(lambda: inventory.fetch(GHCN_META_URL))
+
     logger.info(f"|{sep} Step 0 {sep}|")
     df0 = step_cache.load('step0', sy, ey) if use_cache else None
-    if df0 is None:
-        df0 = step0.step0(GHCN_TEMP_URL, GHCN_META_URL, sy, ey)
+    df1 = None
+    if df0 is not None and args.incremental:
+        state = step_cache.load_arrays('step0_state', sy, ey)
+        df0, changed, state = step0.update(df0, state, GHCN_TEMP_URL, GHCN_META_URL, sy, ey,
+                                           inv=inv())
+        if changed:
+            step_cache.save(df0, 'step0', sy, ey)
+            if state is not None:
+                step_cache.save_arrays(state, 'step0_state', sy, ey)
+            step_cache.save_arrays({'station_ids': np.array(changed, dtype=str)},
+                                   'step0_changed', sy, ey)
+            # Later steps must be recomputed from the updated step0 output.
+            use_cache = False
+        else:
+            logger.info("  GHCN release unchanged; using cached step0.")
+    elif df0 is None and args.fuse_step1 and not args.incremental:
+        # step0 and step1 in one pass; only the step1 output is produced.
+        df1 = step_cache.load('step1', sy, ey) if use_cache else None
+        if df1 is None:
+            df1 = step0.step0(GHCN_TEMP_URL, GHCN_META_URL, sy, ey,
+                              workers=args.workers, inv=inv(),
+                              drop_rules=step1.load_rules(STRANGE_URL, sy, ey))
+            step_cache.save(df1, 'step1', sy, ey)
+        else:
+            logger.info("  Loaded step1 from cache; step0 not needed.")
+    elif df0 is None:
+        df0 = step0.step0(GHCN_TEMP_URL, GHCN_META_URL, sy, ey,
+                          workers=args.workers, inv=inv())
         step_cache.save(df0, 'step0', sy, ey)
+        state = step0.ingest_state(GHCN_TEMP_URL, sy, ey) if args.incremental else None
+        if state is not None:
+            step_cache.save_arrays(state, 'step0_state', sy, ey)
     else:
         logger.info("  Loaded step0 from cache.")
 
     logger.info(f"|{sep} Step 1 {sep}|")
-    df1 = step_cache.load('step1', sy, ey) if use_cache else None
-    if df1 is None:
-        df1 = step1.step1(df0, STRANGE_URL, sy, ey)
-        step_cache.save(df1, 'step1', sy, ey)
+    if df1 is not None:
+        logger.info("  Done in the step0 pass (--fuse-step1).")
     else:
-        logger.info("  Loaded step1 from cache.")
+        df1 = step_cache.load('step1', sy, ey) if use_cache else None
+        if df1 is None:
+            df1 = step1.step1(df0, STRANGE_URL, sy, ey)
+            step_cache.save(df1, 'step1', sy, ey)
+        else:
+            logger.info("  Loaded step1 from cache.")
 
     logger.info(f"|{sep} Step 2 {sep}|")
     df2 = step_cache.load('step2', sy, ey) if use_cache else None
     if df2 is None:
-        df2 = step2.step2(df1, GHCN_META_URL, BRIGHTNESS_URL, sy, ey)
+        step2_args = dict(inv=inv(), augmented_inv=args.augmented_inv, workers=args.workers,
+                          memory_budget=None if args.memory_budget is None
+                          else args.memory_budget << 20)
+        if args.incremental:
+            # Refit only the urban stations whose neighbourhood changed.
+            state = step_cache.load_arrays('step2_state', sy, ey)
+            df2, state = step2.update(df1, state, GHCN_META_URL, BRIGHTNESS_URL, sy, ey,
+                                      **step2_args)
+            step_cache.save_arrays(state, 'step2_state', sy, ey)
+        else:
+            df2 = step2.step2(df1, GHCN_META_URL, BRIGHTNESS_URL, sy, ey, **step2_args)
         step_cache.save(df2, 'step2', sy, ey)
     else:
         logger.info("  Loaded step2 from cache.")
 
     logger.info(f"|{sep} Step 3 {sep}|")
+    extra_radii = [r for r in args.extra_radii if r != step3.GRIDDING_RADIUS]
     df3 = step_cache.load('step3', sy, ey) if use_cache else None
-    if df3 is None:
-        df3 = step3.step3(df2, sy, ey)
+    if df3 is None or any(step_cache.load(f'step3_{r:g}km', sy, ey) is None for r in extra_radii):
+        # All radii share one station sort and one set of distances.
+        frames = step3.step3(df2, sy, ey, radius=[step3.GRIDDING_RADIUS, *extra_radii],
+                             inv=inv(), workers=args.workers)
+        df3 = frames[step3.GRIDDING_RADIUS]
         step_cache.save(df3, 'step3', sy, ey)
+        for r in extra_radii:
+            step_cache.save(frames[r], f'step3_{r:g}km', sy, ey)
     else:
         logger.info("  Loaded step3 from cache.")
 
@@ -13,45 +13,72 @@ import urllib.request
 import numpy as np
 import pandas as pd
 
+from steps import step1
+from utils import frames, ghcn, inputs, inventory
 from utils.logger import logger
 from utils.config import INPUT_DIR
 
 
-def _fetch_ghcn_temps(url: str, start_year: int, end_year: int):
+def _read_ghcn_fwf(path: str) -> pd.DataFrame:
+    """Line-oriented fallback parser (pd.read_fwf) for files whose lines are
+    not all the same length. Month values are raw 0.01 °C integers."""
+    colspecs = [(0, 11), (11, 15)] + [(19 + 8 * i, 24 + 8 * i) for i in range(12)]
+    names = ["Station_ID", "Year"] + [str(m) for m in range(1, 13)]
+
+    return pd.read_fwf(
+        path,
+        colspecs=colspecs,
+        names=names,
+        dtype={"Station_ID": str},
+    )
+
+
+def _read_ghcn(path: str, start_year: int, end_year: int) -> pd.DataFrame:
+    """Parse the GHCN rows with Year in [start_year, end_year].
+
+    Uses the vectorised byte-level reader, which skips out-of-range rows
+    before decoding them. Same columns and values as _read_ghcn_fwf(); falls
+    back to it when the file is not strictly fixed-width.
     """
-    Download and parse the GHCN temperature file.
+    parsed = ghcn.read(path, start_year, end_year)
+    if parsed is None:
+        logger.info("  GHCN file is not fixed-width; falling back to read_fwf.")
+        df = _read_ghcn_fwf(path)
+        return df[(df["Year"] >= start_year) & (df["Year"] <= end_year)].copy()
 
-    GHCN fixed-width format per line:
-      cols  0-10  : Station_ID (11 chars)
-      cols 11-14  : Year       (4 chars)
-      cols 15-18  : Element    (4 chars, always TAVG for this file)
-      then 12 groups of 8 chars each:
-        cols 19+8k .. 23+8k : monthly value in 0.01 °C (-9999 = missing)
-        cols 24+8k .. 26+8k : flags (ignored)
+    ids, years, values = parsed
+    df = pd.DataFrame(values.astype(np.int64), columns=[str(m) for m in range(1, 13)])
+    df.insert(0, "Year", years.astype(np.int64))
+    df.insert(0, "Station_ID", ids.astype(str))
+    return df
 
-    Returns (df_temps, last_ghcn_year) where last_ghcn_year is a Series
-    {Station_ID → last year with any GHCN file entry in [start_year, end_year]}.
-    This matches gistemp4.0's station-record length for the December exclusion.
+
+def _fetch_ghcn_file(url: str) -> str:
+    """Download the GHCN temperature file to input/ if needed; return its path.
+
+    A .gz/.xz copy in input/ is used as-is (read as a stream, never
+    decompressed to disk).
     """
     local_path = os.path.join(INPUT_DIR, 'ghcnm.tavg.qcf.dat')
-    if not os.path.exists(local_path):
+    cached = inputs.resolve(local_path)
+    if cached is None:
         logger.info("Downloading GHCN temperature data...")
         os.makedirs(INPUT_DIR, exist_ok=True)
         urllib.request.urlretrieve(url, local_path)
-    else:
-        logger.info("  GHCN temperature data: using cached file.")
+        return local_path
+    logger.info("  GHCN temperature data: using cached file.")
+    return cached
 
-    colspecs = [(0, 11), (11, 15)] + [(19 + 8 * i, 24 + 8 * i) for i in range(12)]
-    names = ["Station_ID", "Year"] + [str(m) for m in range(1, 13)]
 
-    df = pd.read_fwf(
-        local_path,
-        colspecs=colspecs,
-        names=names,
-        dtype={"Station_ID": str},
-    )
+def _fetch_ghcn_temps(local_path: str, start_year: int, end_year: int):
+    """
+    Parse the GHCN temperature file (layout in utils/ghcn.py) into long format.
 
-    df = df[(df["Year"] >= start_year) & (df["Year"] <= end_year)].copy()
+    Returns (df_temps, last_ghcn_year) where last_ghcn_year is a Series
+    {Station_ID → last year with any GHCN file entry in [start_year, end_year]}.
+    This matches gistemp4.0's station-record length for the December exclusion.
+    """
+    df = _read_ghcn(local_path, start_year, end_year)
 
     # Record the last GHCN year per station BEFORE converting -9999 → NaN.
     # gistemp4.0's station series ends at this year (even if all values are
@@ -64,37 +91,16 @@ def _fetch_ghcn_temps(url: str, start_year: int, end_year: int):
     return df, last_ghcn_year
 
 
-def _fetch_ghcn_meta(url: str) -> pd.DataFrame:
-    """Download and parse GHCN station inventory (lat, lon only)."""
-    local_path = os.path.join(INPUT_DIR, 'v4.inv')
-    if not os.path.exists(local_path):
-        logger.info("Downloading GHCN metadata...")
-        os.makedirs(INPUT_DIR, exist_ok=True)
-        urllib.request.urlretrieve(url, local_path)
-    else:
-        logger.info("  GHCN metadata: using cached file.")
-    df = pd.read_fwf(
-        local_path,
-        widths=[11, 9, 10, 7, 3, 31],
-        names=["Station_ID", "Latitude", "Longitude", "Elevation", "State", "Name"],
-        dtype={"Station_ID": str},
-    )
-    return df[["Station_ID", "Latitude", "Longitude"]]
-
-
-def step0(ghcn_temp_url: str, ghcn_meta_url: str, start_year: int, end_year: int) -> pd.DataFrame:
-    """
-    Download and format GHCN land temperature data.
+def _fetch_ghcn_meta(url: str, inv: inventory.Inventory = None) -> pd.DataFrame:
+    """GHCN station inventory (lat, lon only), downloaded if needed unless
+    an already-loaded *inv* is given."""
+    if inv is None:
+        inv = inventory.fetch(url)
+    return inv.frame()
 
-    Returns a DataFrame indexed by Station_ID. Columns are {month}_{year}
-    (e.g. "1_1880") sorted by year, followed by Latitude, Longitude, and
-    __LastGHCNYear__ (last year with any GHCN file entry, used by step2 to
-    correctly exclude the last December from the monthly mean calculation).
-    Temperature values are in degrees Celsius; missing values are NaN.
-    """
-    df_temps, last_ghcn_year = _fetch_ghcn_temps(ghcn_temp_url, start_year, end_year)
-    df_meta = _fetch_ghcn_meta(ghcn_meta_url)
 
+def _pivot_temps(df_temps: pd.DataFrame) -> pd.DataFrame:
+    """Pivot long-format temperatures to the wide {month}_{year} layout."""
     # Pivot to wide format: rows=Station_ID, multi-level cols=(month, year)
     df_wide = df_temps.pivot(index="Station_ID", columns="Year")
 
@@ -106,7 +112,106 @@ def step0(ghcn_temp_url: str, ghcn_meta_url: str, start_year: int, end_year: int
 
     # Sort columns by year (stable sort preserves month order within each year)
     sorted_cols = sorted(df_wide.columns, key=lambda c: int(c.split("_")[1]))
-    df_wide = df_wide[sorted_cols]
+    return df_wide[sorted_cols]
+
+
+def _rule_rows(ids: np.ndarray, rules: np.ndarray) -> np.ndarray:
+    """Position of each rule's station in the sorted 'S11' *ids*; -1 if absent."""
+    if not len(ids):
+        return np.full(len(rules), -1, dtype=np.intp)
+    pos = np.minimum(np.searchsorted(ids, rules['station']), len(ids) - 1)
+    return np.where(ids[pos] == rules['station'], pos, -1)
+
+
+def _wide_from_cube(cube: ghcn.Cube, start_year: int, end_year: int, drop_rules=None):
+    """
+    Slice [start_year, end_year] out of the GHCN cube.
+
+    Returns (df_wide, last_ghcn_year, n_dropped), identical to pivoting the
+    long-format rows: one column per month of every year with any record in
+    the window, and only stations with at least one valid value.
+
+    With compiled step1 *drop_rules* (step1.load_rules()), dropped stations
+    are never copied out of the cube and masked station-months are NaN-ed in
+    the decoded block, giving step1's output without an intermediate frame;
+    n_dropped is then the number of stations the rules removed.
+    """
+    years, values, present = cube.window(start_year, end_year)
+
+    has_year = present.any(axis=0)
+    keep = (values != ghcn.MISSING).any(axis=(1, 2))
+    rows = np.where(keep)[0]
+
+    n_dropped = 0
+    if drop_rules is not None:
+        gone = step1.dropped_rows(drop_rules, _rule_rows(cube.ids[rows], drop_rules))
+        rows = np.delete(rows, gone)
+        n_dropped = len(gone)
+
+    raw = values[rows][:, has_year]                        # (ns, ny, 12) int16/int32
+    temps = np.where(raw == ghcn.MISSING, np.nan, raw / 100.0)
+    kept_years = years[has_year]
+    columns = [f"{m}_{y}" for y in kept_years for m in range(1, 13)]
+    temps = temps.reshape(len(rows), len(columns))
+
+    if drop_rules is not None:
+        # Flat month (from start_year) → column of temps, -1 for absent years
+        flat = np.arange((end_year - start_year + 1) * 12)
+        year = start_year + flat // 12
+        yi = np.minimum(np.searchsorted(kept_years, year), max(len(kept_years) - 1, 0))
+        found = (kept_years[yi] == year) if len(kept_years) else np.zeros(len(flat), bool)
+        col_of_flat = np.where(found, yi * 12 + flat % 12, -1)
+        station_pos = _rule_rows(cube.ids[rows], drop_rules)
+        temps[step1.mask_targets(drop_rules, station_pos, col_of_flat)] = np.nan
+
+    index = pd.Index(cube.ids[rows].astype(str), dtype=str, name="Station_ID")
+    df_wide = pd.DataFrame(temps, index=index, columns=columns)
+
+    # Last year with a record in the window: the station's last year overall
+    # unless that falls after end_year.
+    last = cube.last_year[rows].astype(np.int64)
+    late = np.where(last > end_year)[0]
+    if len(late):
+        pres = present[rows[late]][:, ::-1]
+        last[late] = years[len(years) - 1 - np.argmax(pres, axis=1)]
+    last_ghcn_year = pd.Series(last, index=index, name="Year")
+
+    return df_wide, last_ghcn_year, n_dropped
+
+
+def step0(ghcn_temp_url: str, ghcn_meta_url: str, start_year: int, end_year: int,
+          workers: int = 1, inv: inventory.Inventory = None,
+          drop_rules: np.ndarray = None) -> pd.DataFrame:
+    """
+    Download and format GHCN land temperature data.
+
+    Returns a DataFrame indexed by Station_ID. Columns are {month}_{year}
+    (e.g. "1_1880") sorted by year, followed by Latitude, Longitude, and
+    __LastGHCNYear__ (last year with any GHCN file entry, used by step2 to
+    correctly exclude the last December from the monthly mean calculation).
+    Temperature values are in degrees Celsius; missing values are NaN.
+
+    The GHCN file is read through its memory-mapped cube (utils/ghcn.py),
+    built on first use with *workers* processes; compressed files and files
+    that are not fixed-width are parsed directly. *inv* is the station
+    inventory, if the caller has already loaded it (utils/inventory.py).
+
+    Fused with step1: given the compiled Ts.strange rules as *drop_rules*
+    (step1.load_rules()), the rules are applied while the cube is sliced and
+    the result is identical to step1.step1(step0(...)).
+    """
+    local_path = _fetch_ghcn_file(ghcn_temp_url)
+    cube = None
+    if not inputs.is_compressed(local_path):
+        cube = ghcn.open_cube(local_path, workers=workers)
+    n_dropped = None
+    if cube is not None:
+        df_wide, last_ghcn_year, n_dropped = _wide_from_cube(
+            cube, start_year, end_year, drop_rules)
+    else:
+        df_temps, last_ghcn_year = _fetch_ghcn_temps(local_path, start_year, end_year)
+        df_wide = _pivot_temps(df_temps)
+    df_meta = _fetch_ghcn_meta(ghcn_meta_url, inv)
 
     # Merge in lat/lon
     df = df_wide.merge(
@@ -119,5 +224,148 @@ def step0(ghcn_temp_url: str, ghcn_meta_url: str, start_year: int, end_year: int
     # Store last GHCN year per station; step2 uses this for the December exclusion.
     df['__LastGHCNYear__'] = last_ghcn_year
 
-    logger.info(f"Step 0 complete: {len(df)} stations loaded ({start_year}–{end_year})")
+    n_loaded = len(df) + (n_dropped or 0)
+    logger.info(f"Step 0 complete: {n_loaded} stations loaded ({start_year}–{end_year})")
+    if drop_rules is not None:
+        if n_dropped is None:
+            df, n_dropped = step1.apply_rules(df, drop_rules, start_year, end_year)
+        logger.info(
+            f"Step 1 complete: {n_dropped} stations dropped, "
+            f"{step1.station_count(drop_rules) - n_dropped} partially nulled"
+        )
     return df
+
+
+# ── Incremental ingest ────────────────────────────────────────────────────────
+
+def ingest_state(ghcn_temp_url: str, start_year: int, end_year: int):
+    """
+    Per-(station, year) content hashes of the current GHCN file's records in
+    [start_year, end_year], for the next update() to diff against.
+
+    Returns {'keys': 'S15' Station_ID+Year, 'hashes': uint64}, or None if the
+    file is not fixed-width.
+    """
+    keys, hashes = [], []
+    try:
+        for rec in ghcn.scan(_fetch_ghcn_file(ghcn_temp_url), start_year, end_year):
+            keys.append(ghcn.keys(rec))
+            hashes.append(ghcn.content_hash(rec))
+    except ValueError:
+        return None
+    return {'keys': np.concatenate(keys or [np.empty(0, dtype='S15')]),
+            'hashes': np.concatenate(hashes or [np.empty(0, dtype=np.uint64)])}
+
+
+def _diff(rec, old_keys, old_hashes):
+    """(keys, hashes, decoded) for a chunk of records: decoded holds only the
+    records that are new or whose content hash changed. *old_keys* must be
+    sorted, with *old_hashes* in the same order."""
+    keys, hashes = ghcn.keys(rec), ghcn.content_hash(rec)
+    unchanged = np.zeros(len(keys), dtype=bool)
+    if len(old_keys):
+        pos = np.minimum(np.searchsorted(old_keys, keys), len(old_keys) - 1)
+        unchanged = (old_keys[pos] == keys) & (old_hashes[pos] == hashes)
+    return keys, hashes, ghcn.decode(rec[~unchanged])
+
+
+def update(df_prev: pd.DataFrame, state, ghcn_temp_url: str, ghcn_meta_url: str,
+           start_year: int, end_year: int, inv: inventory.Inventory = None):
+    """
+    Bring a previous step0 output up to date with a new GHCN release.
+
+    *state* is the ingest_state() of the release *df_prev* was built from.
+    Only records whose content hash changed, or that are new, are decoded;
+    records that disappeared are blanked. *df_prev* is patched in place
+    unless the set of year columns changed; stations that become all-missing
+    are dropped and stations that gain data are inserted. Latitude/Longitude
+    are refreshed from the inventory for every row.
+
+    Returns (df, changed, new_state): df is identical to a fresh step0() run
+    and changed is the sorted list of Station_IDs whose records or location
+    changed. Without a usable *state* this falls back to a full step0() and
+    reports every station as changed.
+    """
+    local_path = _fetch_ghcn_file(ghcn_temp_url)
+    chunks = None
+    if state is not None and df_prev is not None:
+        order = np.argsort(state['keys'])
+        old_keys, old_hashes = state['keys'][order], state['hashes'][order]
+        try:
+            chunks = [_diff(rec, old_keys, old_hashes)
+                      for rec in ghcn.scan(local_path, start_year, end_year)]
+        except ValueError:
+            chunks = None
+    if not chunks or any(decoded is None for _, _, decoded in chunks):
+        df = step0(ghcn_temp_url, ghcn_meta_url, start_year, end_year, inv=inv)
+        prev_ids = set() if df_prev is None else set(df_prev.index)
+        new_state = ingest_state(ghcn_temp_url, start_year, end_year)
+        return df, sorted(prev_ids | set(df.index)), new_state
+
+    # Only new/changed records were decoded; vanished ones are blanked below.
+    new_keys = np.concatenate([c[0] for c in chunks])
+    new_hashes = np.concatenate([c[1] for c in chunks])
+    dirty_ids, dirty_years, dirty_values = (
+        np.concatenate(arrays) for arrays in zip(*[c[2] for c in chunks]))
+    n_dirty = len(dirty_ids)
+    old_keys = state['keys']
+    removed_ids, removed_years = ghcn.split_keys(old_keys[~np.isin(old_keys, new_keys)])
+
+    temps = np.where(dirty_values == ghcn.MISSING, np.nan, dirty_values / 100.0)
+
+    all_ids, all_years = ghcn.split_keys(new_keys)
+    years = np.unique(all_years)
+    time_cols = [f"{m}_{y}" for y in years for m in range(1, 13)]
+
+    df = df_prev
+    if frames.time_cols(df) != time_cols:
+        df = df.reindex(columns=time_cols + list(frames.STATION_META_COLS))
+
+    # Rebuild the rows of every affected station: previous values, with
+    # changed/new records overwritten and vanished records blanked.
+    affected = np.unique(np.concatenate([dirty_ids, removed_ids]))
+    index = pd.Index(affected.astype(str), name="Station_ID")
+    block = df.reindex(index)[time_cols].to_numpy(dtype=np.float64, copy=True)
+    block = block.reshape(len(index), len(years), 12)
+
+    row = np.searchsorted(affected, dirty_ids)
+    block[row, np.searchsorted(years, dirty_years)] = temps
+    gone = np.isin(removed_years, years)
+    row = np.searchsorted(affected, removed_ids[gone])
+    block[row, np.searchsorted(years, removed_years[gone])] = np.nan
+    block = block.reshape(len(index), -1)
+
+    # Last year with any record, per affected station
+    mine = np.isin(all_ids, affected)
+    last = pd.Series(all_years[mine].astype(np.int64),
+                     index=all_ids[mine].astype(str)).groupby(level=0).max()
+    last = last.reindex(index)
+
+    keep = ~np.isnan(block).all(axis=1)
+    existing = index.isin(df.index)
+
+    patch = index[keep & existing]
+    df.loc[patch, time_cols] = block[keep & existing]
+    df.loc[patch, '__LastGHCNYear__'] = last[patch].to_numpy(dtype=np.int64)
+    df = df.drop(index=index[~keep & existing])
+
+    df_meta = _fetch_ghcn_meta(ghcn_meta_url, inv).set_index("Station_ID")
+    added = index[keep & ~existing]
+    if len(added):
+        df_new = pd.DataFrame(block[keep & ~existing], index=added, columns=time_cols)
+        df_new = df_new.merge(df_meta, left_index=True, right_index=True, how="left")
+        df_new['__LastGHCNYear__'] = last[added].to_numpy(dtype=np.int64)
+        df = pd.concat([df, df_new]).sort_index()
+
+    # Refresh station locations; a moved station counts as changed.
+    moved = []
+    for col in ('Latitude', 'Longitude'):
+        loc = df_meta[col].reindex(df.index)
+        differs = ~((df[col] == loc) | (df[col].isna() & loc.isna()))
+        moved.extend(df.index[differs])
+        df[col] = loc
+
+    changed = sorted(set(index) | set(moved))
+    logger.info(f"Step 0 update: {n_dirty} new/changed and "
+                f"{len(removed_ids)} removed records, {len(changed)} stations changed")
+    return df, changed, {'keys': new_keys, 'hashes': new_hashes}
@@ -9,12 +9,26 @@ step1 / drop_strange logic exactly.
 import os
 import urllib.request
 
+import numpy as np
 import pandas as pd
 
+from utils import cache as step_cache
 from utils.logger import logger
 from utils.config import INPUT_DIR
 
 
+def _fetch_strange_file(url: str) -> str:
+    """Download Ts.strange.v4.list.IN_full to input/ if needed; return its path."""
+    local_path = os.path.join(INPUT_DIR, 'Ts.strange.v4.list.IN_full')
+    if not os.path.exists(local_path):
+        logger.info("Downloading Ts.strange.v4.list.IN_full...")
+        os.makedirs(INPUT_DIR, exist_ok=True)
+        urllib.request.urlretrieve(url, local_path)
+    else:
+        logger.info("  Ts.strange: using cached file.")
+    return local_path
+
+
 def _fetch_changes(url: str) -> dict:
     """
     Parse Ts.strange.v4.list.IN_full into a changes dict.
@@ -25,14 +39,11 @@ def _fetch_changes(url: str) -> dict:
 
     Returns {station_id: [entry, ...]}
     """
-    local_path = os.path.join(INPUT_DIR, 'Ts.strange.v4.list.IN_full')
-    if not os.path.exists(local_path):
-        logger.info("Downloading Ts.strange.v4.list.IN_full...")
-        os.makedirs(INPUT_DIR, exist_ok=True)
-        urllib.request.urlretrieve(url, local_path)
-    else:
-        logger.info("  Ts.strange: using cached file.")
+    return _parse_changes(_fetch_strange_file(url))
+
 
+def _parse_changes(local_path: str) -> dict:
+    """_fetch_changes() for an already-downloaded file."""
     with open(local_path) as f:
         text = f.read()
 
@@ -57,56 +68,138 @@ def _fetch_changes(url: str) -> dict:
     return changes
 
 
-def step1(df: pd.DataFrame, strange_url: str, start_year: int, end_year: int) -> pd.DataFrame:
-    """
-    Apply drop rules from Ts.strange.v4.list.IN_full.
+# ── Compiled rules ────────────────────────────────────────────────────────────
+#
+# Each Ts.strange entry becomes one row of a structured array, resolved
+# against the run's year range: DROP removes the whole station, MASK sets
+# the flat months [start, end] to NaN (flat index (year - start_year) * 12 +
+# month - 1), and NOOP entries fall outside the range or name an ID that is
+# not 11 characters (no GHCN station; its station field is left empty rather
+# than truncated onto a real ID). NOOP rows are kept so the per-station
+# counts in the log stay the same: station_no numbers the file's distinct
+# IDs as written, so the count never depends on the 'S11' conversion.
 
-    Drops entire station rows or NaN-s specific month/year ranges,
-    matching gistemp4.0 drop_strange() behaviour exactly.
-    """
-    changes = _fetch_changes(strange_url)
+NOOP, DROP, MASK = -1, 0, 1
 
-    df = df.copy()
-    to_drop = []
+RULE_DTYPE = np.dtype([('station', 'S11'), ('station_no', 'i4'), ('kind', 'i1'),
+                       ('start', 'i4'), ('end', 'i4')])
 
-    for station_id, entries in changes.items():
-        if station_id not in df.index:
-            continue
 
+def _compile_rules(changes: dict, start_year: int, end_year: int) -> np.ndarray:
+    """Resolve a _fetch_changes() dict into a RULE_DTYPE array."""
+    n_months = (end_year - start_year + 1) * 12
+    rows = []
+    for station_no, (station_id, entries) in enumerate(changes.items()):
+        # IDs that are not 11 characters can never match a GHCN station
+        valid_id = len(station_id) == 11
+        key = station_id.encode() if valid_id else b''
         for (kind, val1, val2) in entries:
+            rule = (NOOP, 0, 0)
             if kind == 'years':
-                year1, year2 = val1, val2
+                if val1 <= start_year and val2 >= end_year:
+                    rule = (DROP, 0, n_months - 1)
+                else:
+                    # Clamp to data range (mirrors gistemp4.0's max/min logic)
+                    year1 = max(val1, start_year)
+                    year2 = min(val2, end_year)
+                    if year2 >= year1:
+                        rule = (MASK, (year1 - start_year) * 12,
+                                (year2 - start_year) * 12 + 11)
+            else:  # 'month'
+                yr, mo = val1, val2
+                if start_year <= yr <= end_year and 1 <= mo <= 12:
+                    fi = (yr - start_year) * 12 + mo - 1
+                    rule = (MASK, fi, fi)
+            if not valid_id:
+                rule = (NOOP, 0, 0)
+            rows.append((key, station_no) + rule)
+    return np.array(rows, dtype=RULE_DTYPE)
 
-                # Drop entire station if range covers the full data span
-                if year1 <= start_year and year2 >= end_year:
-                    to_drop.append(station_id)
-                    break
 
-                # Clamp to data range (mirrors gistemp4.0's max/min logic)
-                year1 = max(year1, start_year)
-                year2 = min(year2, end_year)
+def load_rules(strange_url: str, start_year: int, end_year: int) -> np.ndarray:
+    """Compiled rules for *strange_url* over [start_year, end_year].
 
-                if year2 < year1:
-                    continue
+    The compiled array is cached (cache/step1_rules_<years>.npz) with the
+    strange file's SHA-256, so a rerun with an unchanged file is one array
+    load instead of a re-parse.
+    """
+    local_path = _fetch_strange_file(strange_url)
+    digest = step_cache.file_digest(local_path)
+    cached = step_cache.load_arrays('step1_rules', start_year, end_year)
+    if (cached is not None and str(cached['sha256']) == digest
+            and cached['rules'].dtype == RULE_DTYPE):
+        return cached['rules']
+    rules = _compile_rules(_parse_changes(local_path), start_year, end_year)
+    step_cache.save_arrays({'rules': rules, 'sha256': np.array(digest)},
+                           'step1_rules', start_year, end_year)
+    return rules
+
+
+def mask_targets(rules: np.ndarray, station_pos: np.ndarray, col_of_flat: np.ndarray):
+    """(row, col) index pairs of every station-month NaN-ed by the MASK
+    *rules*. The rules' stations sit at rows *station_pos* (-1 = not present)
+    and flat month f is column col_of_flat[f] (-1 = no such column)."""
+    mask = (rules['kind'] == MASK) & (station_pos >= 0)
+    starts, ends = rules['start'][mask], rules['end'][mask]
+    lengths = (ends - starts + 1).astype(np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    flat = (np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+            + np.repeat(starts, lengths))
+    rows, cols = np.repeat(station_pos[mask], lengths), col_of_flat[flat]
+    hit = cols >= 0
+    return rows[hit], cols[hit]
+
+
+def dropped_rows(rules: np.ndarray, station_pos: np.ndarray) -> np.ndarray:
+    """Sorted rows of the stations removed outright by DROP *rules*."""
+    return np.unique(station_pos[(rules['kind'] == DROP) & (station_pos >= 0)])
+
+
+def station_count(rules: np.ndarray) -> int:
+    """Number of distinct stations named in the strange file."""
+    return len(np.unique(rules['station_no']))
+
+
+def apply_rules(df: pd.DataFrame, rules: np.ndarray, start_year: int, end_year: int):
+    """Apply compiled *rules* to a step0 DataFrame.
+
+    Whole-station drops are one row mask; every masked station-month is set
+    to NaN in a single scatter into the (station, month) matrix. Returns
+    (df, n_dropped); df is identical to the entry-by-entry drop_strange.
+    """
+    station_pos = df.index.get_indexer(rules['station'].astype(str))
 
-                cols = [
-                    f'{mo}_{yr}'
-                    for yr in range(year1, year2 + 1)
-                    for mo in range(1, 13)
-                    if f'{mo}_{yr}' in df.columns
-                ]
-                df.loc[station_id, cols] = float('nan')
+    names = [f'{mo}_{yr}' for yr in range(start_year, end_year + 1) for mo in range(1, 13)]
+    col_pos = df.columns.get_indexer(names)
+    present = col_pos >= 0
+    time_cols = [name for name, ok in zip(names, present) if ok]
+    block_col = np.where(present, np.cumsum(present) - 1, -1)
 
-            else:  # 'month'
-                yr, mo = val1, val2
-                col = f'{mo}_{yr}'
-                if col in df.columns:
-                    df.loc[station_id, col] = float('nan')
+    values = df[time_cols].to_numpy(dtype=np.float64, copy=True)
+    values[mask_targets(rules, station_pos, block_col)] = np.nan
 
-    df = df.drop(index=to_drop)
+    other = [c for c in df.columns if c not in set(time_cols)]
+    df_out = pd.concat([pd.DataFrame(values, index=df.index, columns=time_cols),
+                        df[other]], axis=1)[df.columns]
+
+    dropped = dropped_rows(rules, station_pos)
+    keep = np.ones(len(df), dtype=bool)
+    keep[dropped] = False
+    return df_out[keep], len(dropped)
+
+
+def step1(df: pd.DataFrame, strange_url: str, start_year: int, end_year: int) -> pd.DataFrame:
+    """
+    Apply drop rules from Ts.strange.v4.list.IN_full.
+
+    Drops entire station rows or NaN-s specific month/year ranges,
+    matching gistemp4.0 drop_strange() behaviour exactly.
+    """
+    rules = load_rules(strange_url, start_year, end_year)
+    df, n_dropped = apply_rules(df, rules, start_year, end_year)
 
     logger.info(
-        f"Step 1 complete: {len(to_drop)} stations dropped, "
-        f"{len(changes) - len(to_drop)} partially nulled"
+        f"Step 1 complete: {n_dropped} stations dropped, "
+        f"{station_count(rules) - n_dropped} partially nulled"
     )
     return df
@@ -3,16 +3,21 @@ Step 2: Drop short records and apply urban heat-island adjustment.
 
 Matches gistemp4.0 step2 exactly:
   - drop_short_records: stations with max monthly valid count < 20 are dropped
+    (counted on the (station, year, month) matrix that urban_adjustments
+    then reuses)
   - urban_adjustments: urban stations are adjusted using nearby rural station
     anomalies or dropped if no suitable rural neighbourhood can be found
 """
 
+import hashlib
 import math
 import os
 
 import numpy as np
 import pandas as pd
 
+from utils import brightness, frames, inputs, inventory, parallel, spatial
+from utils import cache as step_cache
 from utils.logger import logger
 from utils.config import INPUT_DIR
 
@@ -33,6 +38,10 @@ URBAN_REVERSE_GRADIENT = 0.02
 RURAL_MIN_OVERLAP = 20
 
 _INF_RMS = 1e20
+_FIT_RTOL = 1e-9                             # _knee_rms() tolerance, relative
+_BLOCKS_PER_WORKER = 8                       # urban blocks per pool worker
+_ANOMALY_COPIES = 4                          # monthly-matrix-sized arrays alive at once
+                                             # in _compute_annual_anomalies()
 
 
 # ── I/O helpers ───────────────────────────────────────────────────────────────
@@ -52,88 +61,115 @@ def _read_global_light_from_augmented_inv(path: str) -> pd.Series:
             raw = line[69:74].strip() if len(line) > 69 else ''
             gl = int(raw) if raw.lstrip('-').isdigit() else None
             rows.append({'Station_ID': uid, 'global_light': gl})
-    return pd.DataFrame(rows).set_index('Station_ID')['global_light']
+    # Stations without a value are left out, so they count as rural (as an
+    # unlisted station does) rather than comparing NaN <= threshold.
+    return pd.DataFrame(rows).set_index('Station_ID')['global_light'].dropna().astype(np.int64)
 
 
-def _compute_global_light_from_brightness(meta_url: str,
-                                           brightness_path: str) -> pd.Series:
+def _compute_global_light_from_brightness(inv: inventory.Inventory,
+                                           brightness_path: str,
+                                           station_ids=None) -> pd.Series:
     """Compute global_light by replicating gistemp4.0's generate_brightness.
 
-    Reads station lat/lon from *meta_url* and the pre-downloaded brightness
-    grid from *brightness_path* (wrld-rad.data.txt).
+    Takes station lat/lon from the inventory *inv* and the pre-downloaded
+    brightness grid from *brightness_path* (wrld-rad.data.txt). Only the
+    inventory stations in *station_ids* are looked up, if given.
 
     Matches generate_brightness.run() exactly.
     """
-    # Load station lat/lon from v4.inv (cached in input/ by step0)
-    local_inv = os.path.join(INPUT_DIR, 'v4.inv')
-    if os.path.exists(local_inv):
-        with open(local_inv) as f:
-            inv_text = f.read()
+    located = ~(np.isnan(inv.lat) | np.isnan(inv.lon))
+    if station_ids is not None:
+        located &= np.isin(inv.ids, np.asarray(station_ids, dtype='S11'))
+    ids = inv.ids[located].astype(str)
+    lat, lon = inv.lat[located], inv.lon[located]
+
+    logger.info(f"  Loading brightness raster for {brightness_path} …")
+    raster = brightness.open_raster(brightness_path)
+    gl = pd.Series(brightness.lookup(raster, lat, lon),
+                   index=pd.Index(ids, name='Station_ID'), name='global_light')
+    # A station listed twice keeps its last entry, as the old dict did
+    return gl[~gl.index.duplicated(keep='last')]
+
+
+def _cached_global_light(inv: inventory.Inventory, brightness_path: str,
+                         station_ids) -> pd.Series:
+    """global_light for *station_ids*, through the persistent table in
+    cache/global_light.npz.
+
+    The table is valid for one (v4.inv SHA-256, brightness file) pair and
+    grows as new stations are asked for; a warm run whose stations are all
+    in it never opens the brightness file or its raster.
+    """
+    bright = inputs.resolve(brightness_path)
+    table = step_cache.load_arrays('global_light')
+    if table is not None:
+        stamp = {k: table[f'bright_{k}'].item() for k in ('size', 'mtime_ns', 'sha256')}
+        mtime_ns = stamp['mtime_ns']
+        if str(table['inv_sha256']) != inv.sha256 or not step_cache.is_current(stamp, bright):
+            table = None
+        elif stamp['mtime_ns'] != mtime_ns:
+            table['bright_mtime_ns'] = np.array(stamp['mtime_ns'])
+            step_cache.save_arrays(table, 'global_light')
+    if table is None:
+        stamp = brightness.stamp(bright)
+        table = {'ids': np.empty(0, dtype='S11'), 'light': np.empty(0, dtype=np.int64),
+                 'found': np.empty(0, dtype=bool), 'inv_sha256': np.array(inv.sha256),
+                 **{f'bright_{k}': np.array(stamp[k]) for k in ('size', 'mtime_ns', 'sha256')}}
+
+    wanted = np.unique(np.asarray(station_ids, dtype='S11'))
+    missing = wanted[~np.isin(wanted, table['ids'])]
+    if len(missing):
+        logger.info(f"  global_light: looking up {len(missing)} new stations …")
+        new = _compute_global_light_from_brightness(inv, bright, missing.astype(str))
+        # Stations with no inventory location are recorded as not found
+        light = np.zeros(len(missing), dtype=np.int64)
+        found = np.zeros(len(missing), dtype=bool)
+        pos = np.searchsorted(missing, new.index.to_numpy(dtype='S11'))
+        light[pos], found[pos] = new.to_numpy(), True
+        ids = np.concatenate([table['ids'], missing])
+        order = np.argsort(ids, kind='stable')
+        table['ids'] = ids[order]
+        table['light'] = np.concatenate([table['light'], light])[order]
+        table['found'] = np.concatenate([table['found'], found])[order]
+        step_cache.save_arrays(table, 'global_light')
     else:
-        import urllib.request
-        logger.info("  Downloading v4.inv …")
-        os.makedirs(INPUT_DIR, exist_ok=True)
-        urllib.request.urlretrieve(meta_url, local_inv)
-        with open(local_inv) as f:
-            inv_text = f.read()
-    stations = {}
-    for line in inv_text.splitlines():
-        parts = line.split()
-        if len(parts) < 3:
-            continue
-        uid = line[0:11].strip()
-        try:
-            lat = float(parts[1])
-            lon = float(parts[2])
-        except (ValueError, IndexError):
-            continue
-        stations[uid] = (lat, lon)
-
-    # Load brightness grid
-    logger.info(f"  Loading brightness grid from {brightness_path} …")
-    i_j_dict = {}
-    with open(brightness_path) as f:
-        for line in f:
-            parts = line.split()
-            if len(parts) >= 3:
-                i_j_dict[(parts[0], parts[1])] = parts[2]
-
-    # Compute global_light per station (matches generate_brightness formula)
-    rows = []
-    for uid, (lat, lon) in stations.items():
-        si = round((lon + 180.0) * 120 + 1)
-        sj = round(21600 + 0.5 - (lat + 90.0) * 120)
-        if sj >= 21600:
-            sj = 21600
-        if si >= 43200:
-            si = 1
-        gl_str = i_j_dict.get((str(si), str(sj)), '0')
-        try:
-            gl = int(gl_str)
-        except ValueError:
-            gl = 0
-        rows.append({'Station_ID': uid, 'global_light': gl})
-
-    return pd.DataFrame(rows).set_index('Station_ID')['global_light']
-
-
-def _get_global_light(meta_url: str, brightness_url: str) -> pd.Series:
-    """Return {Station_ID: global_light} for all stations.
-
-    Downloads wrld-rad.data.txt to input/ on first run and caches it there.
+        logger.info("  global_light: all stations cached.")
+
+    pos = np.searchsorted(table['ids'], wanted)
+    found = table['found'][pos]
+    return pd.Series(table['light'][pos][found],
+                     index=pd.Index(wanted[found].astype(str), name='Station_ID'),
+                     name='global_light')
+
+
+def _get_global_light(meta_url: str, brightness_url: str,
+                      inv: inventory.Inventory = None,
+                      station_ids=None,
+                      augmented_inv: str = None) -> pd.Series:
+    """Return {Station_ID: global_light} for *station_ids* (default: every
+    inventory station).
+
+    With *augmented_inv*, the path of a GISTEMP-augmented v4.inv, the values
+    are read from that file and the brightness grid is not used at all.
+    Otherwise wrld-rad.data.txt is downloaded to input/ on first run, and
+    lookups for given *station_ids* go through the persistent global_light
+    table. The station inventory is *inv*, or is loaded from *meta_url*.
     """
+    if augmented_inv is not None:
+        return _read_global_light_from_augmented_inv(augmented_inv)
+
     import urllib.request
     local_bright = os.path.join(INPUT_DIR, 'wrld-rad.data.txt')
-    if not os.path.exists(local_bright):
+    if inputs.resolve(local_bright) is None:
         logger.info(f"  Downloading wrld-rad.data.txt …")
         os.makedirs(INPUT_DIR, exist_ok=True)
         urllib.request.urlretrieve(brightness_url, local_bright)
 
-    return _compute_global_light_from_brightness(meta_url, local_bright)
-
-
-def _time_cols(df: pd.DataFrame):
-    return [c for c in df.columns if c not in ('Latitude', 'Longitude', '__LastGHCNYear__')]
+    if inv is None:
+        inv = inventory.fetch(meta_url)
+    if station_ids is None or inv.sha256 is None:
+        return _compute_global_light_from_brightness(inv, local_bright, station_ids)
+    return _cached_global_light(inv, local_bright, station_ids)
 
 
 # ── Annual-anomaly computation ────────────────────────────────────────────────
@@ -218,53 +254,83 @@ def _compute_annual_anomalies(mat: np.ndarray) -> np.ndarray:
     return annual
 
 
+def _block_size(start_year: int, end_year: int, memory_budget: int) -> int:
+    """Stations per _build_matrix() block such that the block and
+    _ANOMALY_COPIES matrices of its size fit in *memory_budget* bytes."""
+    n_years = end_year - start_year + 1
+    return max(1, int(memory_budget) // (_ANOMALY_COPIES * n_years * 12 * 8))
+
+
+def _matrix_blocks(df: pd.DataFrame, start_year: int, end_year: int, memory_budget: int):
+    """Yield (rows, block): _build_matrix() of consecutive slices of *df*'s
+    stations, each small enough that it and _compute_annual_anomalies()'s
+    temporaries fit in *memory_budget* bytes."""
+    size = _block_size(start_year, end_year, memory_budget)
+    for lo in range(0, len(df), size):
+        rows = slice(lo, lo + size)
+        yield rows, _build_matrix(df.iloc[rows], start_year, end_year)
+
+
+def _annual_anomalies(df: pd.DataFrame, start_year: int, end_year: int,
+                      mat: np.ndarray = None, memory_budget: int = None):
+    """
+    Annual anomalies of every station in *df*: returns (annual, mat).
+
+    *mat* is df's _build_matrix() array, if already built. Without it or
+    *memory_budget*, it is built and annual is computed from it in one go.
+    With a budget in bytes, stations are streamed through
+    _matrix_blocks() instead; only the (n_stations, n_years) result is
+    kept and mat is None. A station's anomalies depend on its own row only,
+    so the two agree exactly.
+    """
+    if mat is not None or memory_budget is None:
+        if mat is None:
+            mat = _build_matrix(df, start_year, end_year)
+        return _compute_annual_anomalies(mat), mat
+
+    annual = np.empty((len(df), end_year - start_year + 1), dtype=np.float64)
+    for rows, block in _matrix_blocks(df, start_year, end_year, memory_budget):
+        annual[rows] = _compute_annual_anomalies(block)
+    return annual, None
+
+
 # ── Station annotation container ──────────────────────────────────────────────
 
 class _Ann:
     """Lightweight struct holding a station's precomputed annotation data."""
-    __slots__ = ('uid', 'anomalies', 'cslat', 'snlat', 'cslon', 'snlon', 'weight')
+    __slots__ = ('uid', 'anomalies', 'cslat', 'snlat', 'cslon', 'snlon')
 
-    def __init__(self, uid, anomalies, lat_deg, lon_deg):
+    def __init__(self, uid, anomalies, snlat, cslat, snlon, cslon):
         self.uid = uid
         self.anomalies = anomalies          # 1-D np.ndarray, length n_years
-        pi180 = math.pi / 180.0
-        self.cslat = math.cos(lat_deg * pi180)
-        self.snlat = math.sin(lat_deg * pi180)
-        self.cslon = math.cos(lon_deg * pi180)
-        self.snlon = math.sin(lon_deg * pi180)
-        self.weight = 0.0
+        self.snlat, self.cslat = snlat, cslat
+        self.snlon, self.cslon = snlon, cslon
 
 
 # ── Rural-neighbour finding ───────────────────────────────────────────────────
 
-def _get_neighbours(us: _Ann,
-                    rural: list,
-                    r_snlat: np.ndarray,
-                    r_cslat: np.ndarray,
-                    r_cslon: np.ndarray,
-                    r_snlon: np.ndarray,
-                    radius: float) -> list:
-    """Return rural stations within *radius* km of *us*, with .weight set.
+def _neighbour_candidates(us: _Ann, rural_index: spatial.CapIndex, radius: float):
+    """(idx, csdbyr) of the rural stations within *radius* km of *us*, in
+    rural order, from the spatial index over the rural stations."""
+    return rural_index.query(us.snlat, us.cslat, us.snlon, us.cslon, radius / EARTH_RADIUS)
 
-    Vectorised over the rural-station array; matches gistemp4.0's
-    get_neighbours() formula exactly.
+
+def _get_neighbours(candidates, radius: float):
+    """Return (idx, weights) of the rural stations within *radius* km.
+
+    *candidates* is a _neighbour_candidates() result for a radius of at
+    least *radius*; the stations are filtered from it rather than searched
+    for again. Matches gistemp4.0's get_neighbours() formula exactly; the
+    weights are returned instead of being stored on the stations.
     """
     cos_crit = math.cos(radius / EARTH_RADIUS)
     rbyrc = EARTH_RADIUS / radius
 
-    csdbyr = (r_snlat * us.snlat
-              + r_cslat * us.cslat * (r_cslon * us.cslon + r_snlon * us.snlon))
-
-    idx = np.where(csdbyr > cos_crit)[0]
-    neighbours = []
-    for i in idx:
-        c = float(csdbyr[i])
-        dbyrc = 0.0
-        if c < 1.0:
-            dbyrc = rbyrc * math.sqrt(2.0 * (1.0 - c))
-        rural[i].weight = 1.0 - dbyrc
-        neighbours.append(rural[i])
-    return neighbours
+    idx, csdbyr = candidates
+    hit = csdbyr > cos_crit
+    idx, csdbyr = idx[hit], csdbyr[hit]
+    dbyrc = np.where(csdbyr < 1.0, rbyrc * np.sqrt(2.0 * (1.0 - np.minimum(csdbyr, 1.0))), 0.0)
+    return idx, 1.0 - dbyrc
 
 
 # ── Rural-series combination ──────────────────────────────────────────────────
@@ -304,106 +370,119 @@ def _cmbine(combined: np.ndarray,
     counts[valid_new] += 1
 
 
-def _combine_neighbours(n_years: int, neighbours: list):
+def _combine_neighbours(n_years: int, anomalies: np.ndarray, weights: np.ndarray):
     """Combine neighbours' annual-anomaly series into one weighted series.
 
+    *anomalies* holds one neighbour per row, in neighbour order, and
+    *weights* their weights (see _get_neighbours()).
     Matches gistemp4.0's combine_neighbours().
     Returns (counts, combined), both numpy arrays of length n_years.
     """
-    weights = np.zeros(n_years)
+    wts = np.zeros(n_years)
     counts = np.zeros(n_years, dtype=int)
     combined = np.full(n_years, np.nan)
 
-    rs = neighbours[0]
-    an = rs.anomalies
+    weights = weights.tolist()
+    an = anomalies[0]
     end = len(an)
     combined[:end] = an
     for i, anom in enumerate(an):
         if not np.isnan(anom):
-            weights[i] = rs.weight
+            wts[i] = weights[0]
             counts[i] = 1
 
-    for rs in neighbours[1:]:
-        _cmbine(combined, weights, counts, rs.anomalies, rs.weight)
+    for data, weight in zip(anomalies[1:], weights[1:]):
+        _cmbine(combined, wts, counts, data, weight)
 
     return counts, combined
 
 
 # ── Fit-preparation helpers ───────────────────────────────────────────────────
 
-def _prepare_series(from_year: int,
-                    combined: np.ndarray,
-                    urban_anoms: np.ndarray,
-                    counts: np.ndarray):
-    """Build the (year, difference) point list for the linear fit.
+def _valid_series(combined: np.ndarray,
+                  urban_anoms: np.ndarray,
+                  counts: np.ndarray):
+    """The years _prepare_series() can take points from, as arrays.
 
-    Matches gistemp4.0's prepare_series() exactly.
-    Returns (points, quorate_count).
+    Returns (iy, diffs, quorate): the year indices where both *combined*
+    and *urban_anoms* are valid, ascending, the combined-minus-urban
+    difference at each, and the positions in *iy* of the quorate years
+    (at least URBAN_MIN_RURAL_STATIONS rural stations).
     """
-    quorate_count = 0
-    length = 0
-    points = []
-
     assert len(combined) >= len(urban_anoms)
+    n = len(urban_anoms)
+    iy = np.flatnonzero(~np.isnan(combined[:n]) & ~np.isnan(urban_anoms))
+    diffs = combined[iy] - urban_anoms[iy]
+    quorate = np.flatnonzero(counts[iy] >= URBAN_MIN_RURAL_STATIONS)
+    return iy, diffs, quorate
 
-    for iy in range(from_year - BASE_YEAR, len(urban_anoms)):
-        if np.isnan(combined[iy]) or np.isnan(urban_anoms[iy]):
-            continue
-        quorate = counts[iy] >= URBAN_MIN_RURAL_STATIONS
-        if quorate:
-            quorate_count += 1
-        if quorate_count == 0:
-            continue
-        points.append((iy + BASE_YEAR, float(combined[iy]) - float(urban_anoms[iy])))
-        if quorate:
-            length = len(points)
 
-    return points[:length], quorate_count
+def _prepare_series(from_year: int, valid):
+    """Select the points for the linear fit from a _valid_series() result.
+
+    Matches gistemp4.0's prepare_series() exactly: the points run from the
+    first quorate year at or after *from_year* to the last quorate year.
+    Returns (years, diffs, quorate_count), the points as an int64 array of
+    calendar years and a float64 array of differences.
+    """
+    iy, diffs, quorate = valid
+    start = np.searchsorted(iy, from_year - BASE_YEAR)
+    j = np.searchsorted(quorate, start)
+    quorate_count = len(quorate) - j
+    if quorate_count == 0:
+        return iy[:0] + BASE_YEAR, diffs[:0], 0
+    a, b = quorate[j], quorate[-1] + 1
+    return iy[a:b] + BASE_YEAR, diffs[a:b], int(quorate_count)
 
 
 def _rural_difference(urban: _Ann,
-                      rural: list,
-                      r_snlat: np.ndarray, r_cslat: np.ndarray,
-                      r_cslon: np.ndarray, r_snlon: np.ndarray,
+                      rural_anoms: np.ndarray,
+                      rural_index: spatial.CapIndex,
                       n_years: int):
     """Find a combined rural record for *urban* and return
-    (points, quorate_count) or (None, None).
-
-    Matches gistemp4.0's rural_difference().
+    (years, diffs, quorate_count) (see _prepare_series()) or
+    (None, None, None).
+
+    *rural_anoms* is the (n_rural, n_years) annual-anomaly matrix of the
+    rural stations, in the order *rural_index* was built in; it is only read.
+    Matches gistemp4.0's rural_difference(). The index is searched once at
+    the full radius; the half-radius neighbours are a subset of that hit list.
+    Each retry with a later start year selects from the same _valid_series().
     """
     R = URBAN_FULL_RADIUS
+    candidates = _neighbour_candidates(urban, rural_index, R)
     for radius in [R / 2, R]:
-        neighbours = _get_neighbours(urban, rural, r_snlat, r_cslat,
-                                     r_cslon, r_snlon, radius)
-        if not neighbours:
+        idx, weights = _get_neighbours(candidates, radius)
+        if not len(idx):
             continue
 
-        counts, combined = _combine_neighbours(n_years, neighbours)
+        counts, combined = _combine_neighbours(n_years, rural_anoms[idx], weights)
+        valid = _valid_series(combined, urban.anomalies, counts)
         start_year = BASE_YEAR
 
         while True:
-            points, quorate_count = _prepare_series(
-                start_year, combined, urban.anomalies, counts)
+            years, diffs, quorate_count = _prepare_series(start_year, valid)
 
             if quorate_count < URBAN_MIN_YEARS:
                 break
 
-            first = min(points)[0]
-            last = max(points)[0]
+            first = int(years[0])
+            last = int(years[-1])
 
             if quorate_count >= URBAN_PROPORTION_GOOD * (last - first + 0.9):
-                return points, quorate_count
+                return years, diffs, quorate_count
 
             start_year = int(last - (quorate_count - 1) / URBAN_PROPORTION_GOOD)
             start_year = max(start_year, first + 1)
 
-    return None, None
+    return None, None, None
 
 
 # ── Linear-fit helpers ────────────────────────────────────────────────────────
 
-def _trend2(points, xmid, min_pts):
-    """Two-part linear regression at knee *xmid*.
+def _trend2(years, diffs, xmid, min_pts):
+    """Two-part linear regression at knee *xmid* over the points
+    (years[n], diffs[n]), given as lists.
 
     Returns (sl1, sl2, rms, sl) or (None, None, None, None) on failure.
     Matches gistemp4.0's trend2() (using MISSING=9999 sentinel there).
@@ -412,7 +491,7 @@ def _trend2(points, xmid, min_pts):
     sx0 = sx1 = sxx0 = sxx1 = sxa0 = sxa1 = 0.0
     sa = saa = 0.0
 
-    for (x, v) in points:
+    for x, v in zip(years, diffs):
         x -= xmid
         sa += v
         saa += v * v
@@ -443,26 +522,101 @@ def _trend2(points, xmid, min_pts):
     return sl1, sl2, rms, sl
 
 
-def _getfit(points):
-    """Find the best two-part linear fit over all candidate knee positions.
+def _getfit_loop(years, diffs):
+    """_getfit() by calling _trend2() at every candidate knee: O(n²)."""
+    years, diffs = years.tolist(), diffs.tolist()
+    rmsmin = _INF_RMS
+    slope1 = slope2 = slope = knee = None
+
+    for n in range(URBAN_MIN_LEG, len(years) - URBAN_MIN_LEG):
+        k = years[n]
+        sl1, sl2, rms, sl = _trend2(years, diffs, k, 2)
+        if rms is not None and rms < rmsmin:
+            rmsmin = rms
+            slope1, slope2, slope, knee = sl1, sl2, sl, k
+
+    return dict(slope1=slope1, slope2=slope2, slope=slope,
+                knee=knee, first=years[0], last=years[-1])
+
+
+def _knee_rms(years, diffs):
+    """(rms, tol) of the two-part fit at every candidate knee of _getfit(),
+    from prefix sums of the points in one vectorised pass.
+
+    The knee at years[n] leaves the points up to n on the left leg, the
+    years being ascending and distinct (as _prepare_series() gives them).
+    Years are taken relative to the first one, and each knee's sums are
+    shifted from the prefix sums; *tol* bounds how far each rms may be from
+    _trend2()'s value through rounding.
+    """
+    x = years.astype(np.float64)
+    v = np.asarray(diffs, dtype=np.float64)
+    x -= x[0]
+    count = len(x)
+    n = np.arange(URBAN_MIN_LEG, count - URBAN_MIN_LEG)
+    k = x[n]
+
+    cx, cxx = np.cumsum(x)[n], np.cumsum(x * x)[n]
+    cv, cxv = np.cumsum(v)[n], np.cumsum(x * v)[n]
+    sa, saa = v.sum(), (v * v).sum()
+    tx, txx, txv = x.sum(), (x * x).sum(), (x * v).sum()
+
+    count0 = n + 1.0
+    count1 = count - count0
+    sx0 = cx - k * count0
+    sx1 = (tx - cx) - k * count1
+    sxx0 = cxx - 2.0 * k * cx + k * k * count0
+    sxx1 = (txx - cxx) - 2.0 * k * (tx - cx) + k * k * count1
+    sxa0 = cxv - k * cv
+    sxa1 = (txv - cxv) - k * (sa - cv)
+
+    with np.errstate(all='ignore'):
+        denom = count * sxx0 * sxx1 - sxx0 * sx1 * sx1 - sxx1 * sx0 * sx0
+        sl1 = (sx0 * (sx1 * sxa1 - sxx1 * sa) + sxa0 * (count * sxx1 - sx1 * sx1)) / denom
+        sl2 = (sx1 * (sx0 * sxa0 - sxx0 * sa) + sxa1 * (count * sxx0 - sx0 * sx0)) / denom
+        ymid = (sa - sl1 * sx0 - sl2 * sx1) / count
+        terms = (count * ymid * ymid, saa,
+                 -2 * ymid * (sa - sl1 * sx0 - sl2 * sx1),
+                 sl1 * sl1 * sxx0, sl2 * sl2 * sxx1,
+                 -2 * sl1 * sxa0, -2 * sl2 * sxa1)
+        rms = sum(terms)
+        tol = _FIT_RTOL * sum(np.abs(t) for t in terms)
+    return rms, tol
+
+
+def _getfit(years, diffs, exact: bool = False):
+    """Find the best two-part linear fit over all candidate knee positions,
+    for the points of _prepare_series().
 
     Returns a dict with keys slope1, slope2, slope, knee, first, last.
     Matches gistemp4.0's getfit().
+
+    The rms of every knee comes from _knee_rms(). Only the knees whose rms
+    is within rounding tolerance of the smallest (or not finite) are then
+    evaluated with _trend2(), in order and with getfit()'s strict '<', so
+    the same knee is chosen and its slopes are _trend2()'s own. *exact*
+    runs _trend2() at every knee instead (_getfit_loop()).
     """
-    first = min(points)[0]
-    last = max(points)[0]
+    if exact or len(years) <= 2 * URBAN_MIN_LEG:
+        return _getfit_loop(years, diffs)
+
+    rms, tol = _knee_rms(years, diffs)
+    finite = np.isfinite(rms)
+    best = np.min((rms + tol)[finite]) if finite.any() else np.inf
+    near = np.flatnonzero(~finite | (rms - tol <= best))
+
+    years, diffs = years.tolist(), diffs.tolist()
     rmsmin = _INF_RMS
     slope1 = slope2 = slope = knee = None
-
-    for n in range(URBAN_MIN_LEG, len(points) - URBAN_MIN_LEG):
-        k = points[n][0]
-        sl1, sl2, rms, sl = _trend2(points, k, 2)
-        if rms is not None and rms < rmsmin:
-            rmsmin = rms
+    for n in (URBAN_MIN_LEG + near).tolist():
+        k = years[n]
+        sl1, sl2, rms_k, sl = _trend2(years, diffs, k, 2)
+        if rms_k is not None and rms_k < rmsmin:
+            rmsmin = rms_k
             slope1, slope2, slope, knee = sl1, sl2, sl, k
 
     return dict(slope1=slope1, slope2=slope2, slope=slope,
-                knee=knee, first=first, last=last)
+                knee=knee, first=years[0], last=years[-1])
 
 
 def _good_two_part_fit(fit) -> bool:
@@ -507,86 +661,268 @@ def _extend_range(urban_anoms: np.ndarray,
     return first, last
 
 
-# ── Record adjustment ─────────────────────────────────────────────────────────
+# ── Urban fits ────────────────────────────────────────────────────────────────
 
-def _adjust_station(row_vals: dict,
-                    start_year: int, end_year: int,
-                    fit: dict,
-                    adjust_first: int, adjust_last: int,
-                    use_two_part: bool,
-                    all_temp_cols: set) -> dict:
-    """
-    Apply the urban heat-island adjustment to one station's monthly data.
-
-    Returns {col: value} with NaN for months outside the adjustment range.
-    Matches gistemp4.0's adjust_record() — output is MISSING for unadjusted
-    months.
-
-    The anomaly year for calendar year *iy* covers Dec(iy-1) through Nov(iy),
-    exactly as in gistemp4.0's adjust_record loop.
-    """
-    sl1 = fit['slope1']
-    sl2 = fit['slope2']
-    if not use_two_part:
-        sl1 = sl2 = fit['slope']
-    knee = fit['knee']
-    fit_first = fit['first']
-    fit_last = fit['last']
-
-    result = {col: np.nan for col in all_temp_cols}
-
-    for iy in range(adjust_first, adjust_last + 1):
-        sl = sl1 if iy <= knee else sl2
-        iya = max(fit_first, min(iy, fit_last))
-        adj = (iya - knee) * sl - (fit_last - knee) * sl2
-
-        # Dec of (iy-1) then Jan..Nov of iy  (mirrors gistemp4.0's flat-index loop)
-        if iy > start_year:
-            col = f'12_{iy - 1}'
-            if col in result:
-                orig = row_vals.get(col, np.nan)
-                if not pd.isna(orig):
-                    result[col] = orig + adj
-
-        for mo in range(1, 12):
-            yr = iy
-            if yr < start_year or yr > end_year:
-                continue
-            col = f'{mo}_{yr}'
-            if col in result:
-                orig = row_vals.get(col, np.nan)
-                if not pd.isna(orig):
-                    result[col] = orig + adj
+def _fit_urban(urban: _Ann,
+               rural_anoms: np.ndarray,
+               rural_index: spatial.CapIndex,
+               n_years: int):
+    """(fit, adjust_first, adjust_last, use_two_part) for one urban station,
+    or None when it has no usable rural neighbourhood."""
+    years, diffs, quorate_count = _rural_difference(urban, rural_anoms, rural_index, n_years)
+    if years is None:
+        return None
+    fit = _getfit(years, diffs)
+    adjust_first, adjust_last = _extend_range(
+        urban.anomalies, quorate_count, fit['first'], fit['last'])
+    return fit, adjust_first, adjust_last, _good_two_part_fit(fit)
 
-    return result
+
+def _fit_urban_block(rural_anoms, rural_trig, urban_anoms, urban_trig, n_years):
+    """_fit_urban() for each row of *urban_anoms*, in order.
+
+    *rural_trig* / *urban_trig* are (4, n) arrays of snlat, cslat, snlon,
+    cslon. Reads its inputs only, so blocks can run in any process.
+    """
+    rural_index = spatial.CapIndex(*rural_trig)
+    return [_fit_urban(_Ann(None, urban_anoms[k], *(float(v) for v in urban_trig[:, k])),
+                       rural_anoms, rural_index, n_years)
+            for k in range(len(urban_anoms))]
+
+
+def _fit_urban_range(rural_spec, rural_trig_spec, urban_spec, urban_trig_spec,
+                     lo, hi, n_years):
+    """Worker: _fit_urban_block() for urban rows lo:hi of the shared arrays."""
+    shms, arrays = zip(*(parallel.attach(spec) for spec in
+                         (rural_spec, rural_trig_spec, urban_spec, urban_trig_spec)))
+    rural_anoms, rural_trig, urban_anoms, urban_trig = arrays
+    try:
+        return _fit_urban_block(rural_anoms, rural_trig, urban_anoms[lo:hi],
+                                urban_trig[:, lo:hi], n_years)
+    finally:
+        del arrays, rural_anoms, rural_trig, urban_anoms, urban_trig
+        for shm in shms:
+            shm.close()
+
+
+def _fit_urban_parallel(rural_anoms, rural_trig, urban_anoms, urban_trig,
+                        n_years, workers):
+    """_fit_urban_block() over a process pool of *workers*, the station
+    matrices handed over in shared memory; results in urban order."""
+    n_blocks = min(len(urban_anoms), workers * _BLOCKS_PER_WORKER)
+    bounds = np.linspace(0, len(urban_anoms), n_blocks + 1).astype(int)
+    with parallel.SharedArray(rural_anoms.shape, np.float64) as sr, \
+         parallel.SharedArray(rural_trig.shape, np.float64) as st, \
+         parallel.SharedArray(urban_anoms.shape, np.float64) as su, \
+         parallel.SharedArray(urban_trig.shape, np.float64) as sv:
+        sr.array[...], st.array[...] = rural_anoms, rural_trig
+        su.array[...], sv.array[...] = urban_anoms, urban_trig
+        with parallel.pool(min(workers, n_blocks)) as pool:
+            jobs = [pool.submit(_fit_urban_range, sr.spec, st.spec, su.spec, sv.spec,
+                                int(lo), int(hi), n_years)
+                    for lo, hi in zip(bounds[:-1], bounds[1:])]
+            return [result for job in jobs for result in job.result()]
+
+
+# ── Record adjustment ─────────────────────────────────────────────────────────
+
+def _adjust_matrix(mat: np.ndarray, results: list, start_year: int) -> np.ndarray:
+    """
+    Apply the urban heat-island adjustment to stations' monthly data.
+
+    *mat* is the (n, n_years, 12) matrix of the stations to adjust (see
+    _build_matrix()) and *results* their _fit_urban() results, row for row.
+    Returns the adjusted matrix, NaN for months outside each station's
+    adjustment range. Matches gistemp4.0's adjust_record() — output is
+    MISSING for unadjusted months.
+
+    Each station gets one offset per anomaly year iy; year iy covers
+    Dec(iy-1) through Nov(iy), exactly as in gistemp4.0's adjust_record
+    loop, so the offsets run to end_year + 1, whose only month is Dec of
+    end_year.
+    """
+    n, n_years, _ = mat.shape
+    fits = [r[0] for r in results]
+    two_part = np.array([r[3] for r in results], dtype=bool)
+    sl = np.array([f['slope'] for f in fits], dtype=np.float64)
+    sl1 = np.where(two_part, np.array([f['slope1'] for f in fits], dtype=np.float64), sl)
+    sl2 = np.where(two_part, np.array([f['slope2'] for f in fits], dtype=np.float64), sl)
+
+    def column(values):
+        return np.array(values, dtype=np.float64)[:, np.newaxis]
+
+    knee = column([f['knee'] for f in fits])
+    fit_first = column([f['first'] for f in fits])
+    fit_last = column([f['last'] for f in fits])
+    adjust_first = column([r[1] for r in results])
+    adjust_last = column([r[2] for r in results])
+
+    years = np.arange(start_year, start_year + n_years + 1, dtype=np.float64)
+    slope = np.where(years <= knee, sl1[:, np.newaxis], sl2[:, np.newaxis])
+    iya = np.maximum(fit_first, np.minimum(years, fit_last))
+    adj = (iya - knee) * slope - (fit_last - knee) * sl2[:, np.newaxis]
+    adj[(years < adjust_first) | (years > adjust_last)] = np.nan
+
+    offsets = np.empty((n, n_years, 12))
+    offsets[:, :, :11] = adj[:, :n_years, np.newaxis]      # Jan..Nov of iy
+    offsets[:, :, 11] = adj[:, 1:]                        # Dec of iy-1
+    return mat + offsets
+
+
+def _matrix_positions(cols, start_year: int, end_year: int) -> np.ndarray:
+    """Flat (year, month) position in a _build_matrix() row of each
+    '{month}_{year}' column in *cols*; -1 for columns outside the years."""
+    pos = np.full(len(cols), -1, dtype=np.intp)
+    for k, col in enumerate(cols):
+        month, year = (int(v) for v in col.split('_'))
+        if start_year <= year <= end_year:
+            pos[k] = (year - start_year) * 12 + month - 1
+    return pos
+
+
+# ── Incremental state ─────────────────────────────────────────────────────────
+
+_FIT_FIELDS = ('slope1', 'slope2', 'slope', 'knee', 'first', 'last')
+
+
+def _row_digest(annual: np.ndarray) -> np.ndarray:
+    """(n,) uint64 BLAKE2b digest of each row's float64 bytes."""
+    rows = np.ascontiguousarray(annual)
+    return np.frombuffer(b''.join(hashlib.blake2b(row.tobytes(), digest_size=8).digest()
+                                  for row in rows), dtype=np.uint64)
+
+
+def _lookup(keys: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Position of each of *ids* in the unsorted *keys*; -1 where absent."""
+    if not len(keys):
+        return np.full(len(ids), -1, dtype=np.intp)
+    order = np.argsort(keys, kind='stable')
+    pos = np.minimum(np.searchsorted(keys[order], ids), len(keys) - 1)
+    return np.where(keys[order][pos] == ids, order[pos], -1)
+
+
+def _dirty_urban(state, inv_sha256, ids, digest, is_rural, trig, urban):
+    """Which urban stations need a new fit, given the *state* of an earlier
+    run: returns a bool mask over *urban* (positions into *ids*).
+
+    A station has changed if it is new, its annual anomalies differ, its
+    rural/urban status flipped, or it is gone. An urban station is refitted
+    if it changed itself, has no earlier fit, one of its earlier neighbours
+    (rural stations within URBAN_FULL_RADIUS) changed, or a changed station
+    that is rural now lies within URBAN_FULL_RADIUS of it. Nothing else
+    enters a fit: the rural stations combine in record-length order with
+    df-order ties, which no other station can reorder.
+    """
+    if (state is None or not len(state['ids'])
+            or str(state['inv_sha256']) != (inv_sha256 or '')):
+        return np.ones(len(urban), dtype=bool)
+
+    old = _lookup(state['ids'], ids)
+    changed = ((old < 0) | (state['digest'][old] != digest)
+               | (state['rural'][old] != is_rural))
+    gone = state['ids'][_lookup(ids, state['ids']) < 0]
+    changed_ids = np.concatenate([ids[changed], gone])
+
+    fit_pos = _lookup(state['urban_ids'], ids[urban])
+    dirty = changed[urban] | (fit_pos < 0)
+
+    # Earlier neighbours that changed
+    hit = np.concatenate([[0], np.cumsum(np.isin(state['nbr_ids'], changed_ids))])
+    offsets = state['nbr_offsets']
+    nbr_changed = hit[offsets[1:]] > hit[offsets[:-1]]
+    if len(nbr_changed):
+        dirty |= (fit_pos >= 0) & nbr_changed[np.maximum(fit_pos, 0)]
+
+    # Changed stations that are now rural: mark the urban stations around them
+    urban_index = spatial.CapIndex(*(t[urban] for t in trig))
+    arc = URBAN_FULL_RADIUS / EARTH_RADIUS
+    for k in np.flatnonzero(changed & is_rural).tolist():
+        dirty[urban_index.query(*(float(t[k]) for t in trig), arc)[0]] = True
+    return dirty
+
+
+def _state_fits(state, urban_ids):
+    """Earlier _fit_urban() results and neighbour IDs of *urban_ids* from
+    *state*, as lists (None where a station has no earlier fit)."""
+    fits, nbrs = [None] * len(urban_ids), [None] * len(urban_ids)
+    if state is None:
+        return fits, nbrs
+    offsets = state['nbr_offsets']
+    for k, j in enumerate(_lookup(state['urban_ids'], urban_ids).tolist()):
+        if j < 0:
+            continue
+        nbrs[k] = state['nbr_ids'][offsets[j]:offsets[j + 1]]
+        if state['fit_ok'][j]:
+            fit = dict(zip(_FIT_FIELDS, state['fit'][j].tolist()))
+            for name in ('knee', 'first', 'last'):
+                fit[name] = int(fit[name])
+            first, last = state['window'][j].tolist()
+            fits[k] = (fit, first, last, bool(state['two_part'][j]))
+    return fits, nbrs
+
+
+def _make_state(inv_sha256, ids, digest, is_rural, urban_ids, fits, nbrs) -> dict:
+    """State arrays for the next incremental run (see _dirty_urban())."""
+    ok = np.array([f is not None for f in fits], dtype=bool)
+    fit = np.zeros((len(fits), len(_FIT_FIELDS)))
+    window = np.zeros((len(fits), 2), dtype=np.int64)
+    two_part = np.zeros(len(fits), dtype=bool)
+    for k in np.flatnonzero(ok).tolist():
+        fit[k] = [fits[k][0][name] for name in _FIT_FIELDS]
+        window[k] = fits[k][1:3]
+        two_part[k] = fits[k][3]
+    offsets = np.zeros(len(nbrs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(n) for n in nbrs])
+    return {'inv_sha256': np.array(inv_sha256 or ''),
+            'ids': ids, 'digest': digest, 'rural': is_rural,
+            'urban_ids': urban_ids, 'fit_ok': ok, 'fit': fit,
+            'window': window, 'two_part': two_part,
+            'nbr_offsets': offsets,
+            'nbr_ids': np.concatenate(nbrs) if nbrs else np.empty(0, dtype='S11')}
 
 
 # ── Public step functions ─────────────────────────────────────────────────────
 
-def drop_short_records(df: pd.DataFrame) -> pd.DataFrame:
+def drop_short_records(df: pd.DataFrame,
+                       start_year: int,
+                       end_year: int,
+                       mat: np.ndarray = None,
+                       memory_budget: int = None):
     """
     Drop stations where no month has >= 20 valid readings across all years.
 
+    The valid readings are counted on the monthly matrix: *mat*, df's
+    _build_matrix() array, if given; otherwise it is built here, or, with
+    *memory_budget* (bytes), streamed in station blocks and not kept.
+    Returns (df, mat) for the kept stations, mat None if not kept.
+
     Matches gistemp4.0's drop_short_records() with station_drop_minimum_months=20.
     """
-    tc = _time_cols(df)
-
-    valid_per_month = pd.DataFrame({
-        m: df[[c for c in tc if c.startswith(f'{m}_')]].notna().sum(axis=1)
-        for m in range(1, 13)
-    }, index=df.index)
+    if mat is None and memory_budget is None:
+        mat = _build_matrix(df, start_year, end_year)
+    if mat is not None:
+        valid_per_month = np.sum(~np.isnan(mat), axis=1)               # (ns, 12)
+    else:
+        valid_per_month = np.zeros((len(df), 12), dtype=np.intp)
+        for rows, block in _matrix_blocks(df, start_year, end_year, memory_budget):
+            valid_per_month[rows] = np.sum(~np.isnan(block), axis=1)
 
-    keep = valid_per_month.max(axis=1) >= STATION_DROP_MIN_MONTHS
+    keep = valid_per_month.max(axis=1, initial=0) >= STATION_DROP_MIN_MONTHS
     n_dropped = int((~keep).sum())
     logger.info(f"  drop_short_records: dropped {n_dropped}, kept {int(keep.sum())}")
-    return df[keep].copy()
+    return df[keep].copy(), (mat[keep] if mat is not None else None)
 
 
 def urban_adjustments(df: pd.DataFrame,
                       meta_url: str,
                       brightness_url: str,
                       start_year: int,
-                      end_year: int) -> pd.DataFrame:
+                      end_year: int,
+                      inv: inventory.Inventory = None,
+                      augmented_inv: str = None,
+                      workers: int = 1,
+                      memory_budget: int = None,
+                      mat: np.ndarray = None) -> pd.DataFrame:
     """
     Apply urban heat-island adjustment.
 
@@ -594,35 +930,62 @@ def urban_adjustments(df: pd.DataFrame,
     adjusted (no sufficient nearby rural data) are dropped.  Adjusted urban
     stations have data outside the adjustment window set to NaN.
 
+    Station positions come from the inventory *inv* (loaded from *meta_url*
+    if not given), which must be the one step0 merged into *df*. global_light
+    is read from *augmented_inv* if given (see _get_global_light()).
+
+    With *workers* > 1 the urban fits run on a process pool; the result is
+    identical to the serial path. *memory_budget* (bytes) caps the monthly
+    matrix used for the annual anomalies (see _annual_anomalies()); *mat*
+    is df's monthly matrix, if already built.
+
     Matches gistemp4.0's urban_adjustments() exactly.
     """
+    return _urban_adjustments(df, meta_url, brightness_url, start_year, end_year,
+                              inv, augmented_inv, workers, memory_budget, mat)[0]
+
+
+def _urban_adjustments(df, meta_url, brightness_url, start_year, end_year,
+                       inv=None, augmented_inv=None, workers=1, memory_budget=None,
+                       mat=None, state=None, incremental=False):
+    """urban_adjustments(), returning (df, state).
+
+    With *incremental*, only the urban stations that _dirty_urban() picks
+    against the earlier *state* (None: all of them) are fitted, the others
+    reusing their fits from it, and the new state is returned; otherwise
+    state is None.
+    """
     n_years = end_year - start_year + 1
 
+    if inv is None:
+        inv = inventory.fetch(meta_url)
+
     logger.info("  Fetching station metadata (global_light)…")
-    gl = _get_global_light(meta_url, brightness_url)
+    gl = _get_global_light(meta_url, brightness_url, inv,
+                           station_ids=df.index, augmented_inv=augmented_inv)
 
     logger.info("  Building monthly matrix and computing annual anomalies…")
-    mat = _build_matrix(df, start_year, end_year)          # (ns, ny, 12)
+    annual_all, mat = _annual_anomalies(df, start_year, end_year, mat, memory_budget)
     station_ids = list(df.index)
-
-    annual_all = _compute_annual_anomalies(mat)             # (ns, ny)
+    snlat, cslat, snlon, cslon = inv.trig(station_ids)
 
     # Annotate stations
     rural = []
     urban_idx = {}   # df-position → _Ann
+    annotated = []   # df-positions of the stations with anomalies
 
     for i, sid in enumerate(station_ids):
         annual = annual_all[i]
         if np.all(np.isnan(annual)):
             continue                                        # no anomalies → pass-through
 
-        lat = float(df.at[sid, 'Latitude'])
-        lon = float(df.at[sid, 'Longitude'])
-        ann = _Ann(sid, annual, lat, lon)
+        ann = _Ann(sid, annual, float(snlat[i]), float(cslat[i]),
+                   float(snlon[i]), float(cslon[i]))
 
         light = gl.get(sid, None)
         is_rural = (light is None) or (light <= RURAL_LIGHT_THRESHOLD)
 
+        annotated.append(i)
         if is_rural:
             rural.append(ann)
         else:
@@ -638,72 +1001,142 @@ def urban_adjustments(df: pd.DataFrame,
 
     logger.info(f"  Rural: {len(rural)}, Urban: {len(urban_idx)}")
 
-    # Pre-build rural trig arrays for vectorised distance computation
-    r_snlat = np.array([r.snlat for r in rural])
-    r_cslat = np.array([r.cslat for r in rural])
-    r_cslon = np.array([r.cslon for r in rural])
-    r_snlon = np.array([r.snlon for r in rural])
-
-    # All temperature column names (used to initialise adjusted rows)
-    tc = _time_cols(df)
-    all_temp_cols = set(tc)
-
-    # Process each urban station
-    adjusted_rows = {}    # sid → {col: value}
-    n_adjusted = n_dropped_urban = 0
-
-    for i, us in urban_idx.items():
-        sid = station_ids[i]
-        points, quorate_count = _rural_difference(
-            us, rural, r_snlat, r_cslat, r_cslon, r_snlon, n_years)
-
-        if points is None:
-            n_dropped_urban += 1
-            continue
-
-        fit = _getfit(points)
-        adjust_first, adjust_last = _extend_range(
-            us.anomalies, quorate_count, fit['first'], fit['last'])
-        use_two_part = _good_two_part_fit(fit)
-
-        row_vals = df.loc[sid, tc].to_dict()
-        adjusted_rows[sid] = _adjust_station(
-            row_vals, start_year, end_year,
-            fit, adjust_first, adjust_last, use_two_part, all_temp_cols)
-        n_adjusted += 1
-
+    # Rural anomalies and positions as matrices, in rural order; the urban
+    # fits only read them, so they can be shared with worker processes.
+    rural_anoms = np.array([r.anomalies for r in rural]).reshape(len(rural), n_years)
+    rural_trig = np.array([[r.snlat, r.cslat, r.snlon, r.cslon] for r in rural]).reshape(-1, 4).T
+    urban_anoms = np.array([u.anomalies for u in urban_idx.values()])
+    urban_anoms = urban_anoms.reshape(len(urban_idx), n_years)
+    urban_trig = np.array([[u.snlat, u.cslat, u.snlon, u.cslon]
+                           for u in urban_idx.values()]).reshape(-1, 4).T
+
+    urban_ids = np.array([station_ids[i] for i in urban_idx], dtype='S11')
+    if incremental:
+        ids = np.array([station_ids[i] for i in annotated], dtype='S11')
+        digest = _row_digest(annual_all[annotated])
+        is_rural = ~np.isin(annotated, list(urban_idx))
+        trig = tuple(t[annotated] for t in (snlat, cslat, snlon, cslon))
+        urban = np.flatnonzero(~is_rural)
+        dirty = _dirty_urban(state, inv.sha256, ids, digest, is_rural, trig, urban)
+        fits, nbrs = _state_fits(state, urban_ids)
+        logger.info(f"  Incremental: refitting {int(dirty.sum())} of {len(urban_ids)} "
+                    f"urban stations")
+    else:
+        dirty = np.ones(len(urban_ids), dtype=bool)
+        fits = [None] * len(urban_ids)
+
+    todo = np.flatnonzero(dirty)
+    if workers > 1 and len(todo):
+        logger.info(f"  Fitting urban stations on {workers} worker processes…")
+        new_fits = _fit_urban_parallel(rural_anoms, rural_trig, urban_anoms[todo],
+                                       urban_trig[:, todo], n_years, workers)
+    else:
+        new_fits = _fit_urban_block(rural_anoms, rural_trig, urban_anoms[todo],
+                                    urban_trig[:, todo], n_years)
+    for k, result in zip(todo.tolist(), new_fits):
+        fits[k] = result
+
+    new_state = None
+    if incremental:
+        rural_ids = np.array([r.uid for r in rural], dtype='S11')
+        rural_index = spatial.CapIndex(*rural_trig)
+        arc = URBAN_FULL_RADIUS / EARTH_RADIUS
+        for k in todo.tolist():
+            nbrs[k] = rural_ids[rural_index.query(*urban_trig[:, k].tolist(), arc)[0]]
+        new_state = _make_state(inv.sha256, ids, digest, is_rural, urban_ids, fits, nbrs)
+
+    adjusted = [(i, result) for i, result in zip(urban_idx, fits) if result is not None]
+    n_adjusted = len(adjusted)
+    n_dropped_urban = len(urban_idx) - n_adjusted
     logger.info(
         f"  Urban adjusted: {n_adjusted}, dropped (no rural): {n_dropped_urban}")
 
     # Drop urban stations that had no rural neighbourhood.
-    dropped_urban = {station_ids[i] for i in urban_idx if station_ids[i] not in adjusted_rows}
-    df_out = df.drop(list(dropped_urban)).copy()
-
-    # Apply all adjustments in one bulk assignment instead of per-row concat.
-    if adjusted_rows:
-        adj_df = pd.DataFrame.from_dict(adjusted_rows, orient='index')
-        shared_cols = [c for c in adj_df.columns if c in df_out.columns]
-        df_out.loc[adj_df.index, shared_cols] = adj_df[shared_cols].values
+    dropped_urban = [station_ids[i] for i, result in zip(urban_idx, fits) if result is None]
+    df_out = df.drop(dropped_urban).copy()
+
+    # Adjust the fitted stations on the monthly matrix and write their
+    # temperature columns back, one assignment per block. Without *mat* the
+    # blocks are sized to *memory_budget*, so the matrix rows, offsets and
+    # write-back values stay within it as in the anomaly pass.
+    tc = frames.time_cols(df)
+    pos = _matrix_positions(tc, start_year, end_year)
+    size = len(adjusted)
+    if mat is None and memory_budget is not None:
+        size = _block_size(start_year, end_year, memory_budget)
+    for lo in range(0, len(adjusted), max(size, 1)):
+        block = adjusted[lo:lo + size]
+        rows = [i for i, _ in block]
+        if mat is not None:
+            sub = mat[rows]
+        else:
+            sub = _build_matrix(df.iloc[rows], start_year, end_year)
+        new = _adjust_matrix(sub, [result for _, result in block], start_year)
+        new = new.reshape(len(rows), -1)
+        values = np.full((len(rows), len(tc)), np.nan)
+        values[:, pos >= 0] = new[:, pos[pos >= 0]]
+        df_out.loc[[station_ids[i] for i in rows], tc] = values
 
     df_out.index.name = 'Station_ID'
-    return df_out
+    return df_out, new_state
 
 
 def step2(df: pd.DataFrame,
           meta_url: str,
           brightness_url: str,
           start_year: int,
-          end_year: int) -> pd.DataFrame:
+          end_year: int,
+          inv: inventory.Inventory = None,
+          augmented_inv: str = None,
+          workers: int = 1,
+          memory_budget: int = None) -> pd.DataFrame:
     """
     Step 2: drop short records then apply urban heat-island adjustment.
 
+    *inv* is the station inventory, if already loaded (utils/inventory.py).
+    *augmented_inv* is an optional GISTEMP-augmented v4.inv to take
+    global_light from instead of the brightness grid. *workers* is the
+    number of processes for the urban fits, and *memory_budget* an optional
+    cap in bytes on the anomaly computation's working memory.
     Returns a DataFrame in the same format as the input.
     """
     logger.info("Step 2: drop short records")
-    df = drop_short_records(df)
+    df, mat = drop_short_records(df, start_year, end_year, memory_budget=memory_budget)
 
     logger.info("Step 2: urban heat-island adjustment")
-    df = urban_adjustments(df, meta_url, brightness_url, start_year, end_year)
+    df = urban_adjustments(df, meta_url, brightness_url, start_year, end_year,
+                           inv, augmented_inv, workers, memory_budget, mat)
 
     logger.info(f"Step 2 complete: {len(df)} stations remain")
     return df
+
+
+def update(df: pd.DataFrame,
+           state,
+           meta_url: str,
+           brightness_url: str,
+           start_year: int,
+           end_year: int,
+           inv: inventory.Inventory = None,
+           augmented_inv: str = None,
+           workers: int = 1,
+           memory_budget: int = None):
+    """
+    step2() that reuses the urban fits of an earlier run.
+
+    *state* is the state returned by the previous update() for the same
+    year range (None: fit every urban station). Only the urban stations
+    whose neighbourhood changed since then are refitted (see
+    _dirty_urban()); the output is identical to step2()'s.
+    Returns (df, state).
+    """
+    logger.info("Step 2: drop short records")
+    df, mat = drop_short_records(df, start_year, end_year, memory_budget=memory_budget)
+
+    logger.info("Step 2: urban heat-island adjustment")
+    df, state = _urban_adjustments(df, meta_url, brightness_url, start_year, end_year,
+                                   inv, augmented_inv, workers, memory_budget, mat,
+                                   state=state, incremental=True)
+
+    logger.info(f"Step 2 complete: {len(df)} stations remain")
+    return df, state
@@ -3,7 +3,9 @@ Step 3: Combine station records into 8000 equal-area subbox anomaly grid.
 
 Matches gistemp4.0 step3 exactly:
   - Stations sorted by good_count descending before gridding
-  - Each subbox collects stations within gridding_radius (1200 km)
+  - Each subbox collects stations within gridding_radius (1200 km), in
+    station order, from the station → subbox weight matrix
+    (utils/gridweights.py; cached per v4.inv and radius)
   - Distance weight: 1 - chord/arc (chord on unit sphere)
   - Series combined with bias-corrected weighted merge (min_overlap=20)
   - Anomalized relative to 1951–1980 reference period
@@ -14,14 +16,15 @@ import math
 import numpy as np
 import pandas as pd
 
-from utils import eqarea
+from utils import gridweights, parallel
 from utils.logger import logger
 
-EARTH_RADIUS     = 6375.0  # matches gistemp4.0/steps/earth.py
 GRIDDING_RADIUS  = 1200.0
 MIN_OVERLAP      = 20
 REFERENCE_PERIOD = (1951, 1980)
 
+_BLOCKS_PER_WORKER = 8   # subbox ranges per pool worker
+
 _META_COLS = {'Latitude', 'Longitude', '__LastGHCNYear__'}
 
 
@@ -41,8 +44,50 @@ def _build_flat_matrix(df, start_year, end_year):
     return mat
 
 
+def _seq_sum(a):
+    """Column sums of the 2-D *a*, added strictly top to bottom starting from
+    0.0: the same float, bit for bit, as Python's sum() over each column.
+
+    np.add.accumulate is sequential (unlike np.sum's pairwise reduction);
+    the leading 0.0 row makes an all-(-0.0) column sum to 0.0, as sum()
+    does. Pass gaps as 0.0, which leaves the running sum unchanged.
+    """
+    acc = np.zeros((len(a) + 1, a.shape[1]))
+    acc[1:] = a
+    return np.add.accumulate(acc, axis=0)[-1]
+
+
 def _combine(comp, comp_wt, new_s, new_wt, min_overlap):
-    """Bias-corrected weighted merge of new_s into comp.
+    """Bias-corrected weighted merge of new_s into comp, all months at once.
+
+    Same contract and bit-identical results as _combine_loop(): the series
+    are viewed as (n_years, 12) and each month's overlap sums come from
+    _seq_sum() in v4's order. Mutates comp and comp_wt in-place; returns
+    list of 12 per-month combined counts.
+    """
+    c = comp.reshape(-1, 12)
+    w = comp_wt.reshape(-1, 12)
+    s = new_s.reshape(-1, 12)
+    s_ok = ~np.isnan(s)
+    both = ~np.isnan(c) & s_ok
+    n = both.sum(axis=0)
+    n_valid = s_ok.sum(axis=0)
+    active = (n >= min_overlap) & (n_valid > 0)
+    if not active.any():
+        return [0] * 12
+
+    with np.errstate(all='ignore'):
+        bias = (_seq_sum(np.where(both, c, 0.0)) - _seq_sum(np.where(both, s, 0.0))) / n
+    upd = s_ok & active
+    new_total = w + new_wt
+    old_val = np.where(np.isnan(c), 0.0, c)
+    c[upd] = ((w * old_val + new_wt * (s + bias)) / new_total)[upd]
+    w[upd] = new_total[upd]
+    return np.where(active, n_valid, 0).tolist()
+
+
+def _combine_loop(comp, comp_wt, new_s, new_wt, min_overlap):
+    """Bias-corrected weighted merge of new_s into comp, month by month.
 
     Mutates comp and comp_wt in-place.
     Matches gistemp4.0 series.combine() with NaN instead of MISSING.
@@ -74,6 +119,26 @@ def _combine(comp, comp_wt, new_s, new_wt, min_overlap):
 
 
 def _anomalize(series, start_year, ref_period=REFERENCE_PERIOD):
+    """Anomalize flat monthly array in-place, all months at once.
+
+    Same contract and bit-identical results as _anomalize_loop(), with the
+    per-month means summed by _seq_sum() over the (n_years, 12) view.
+    """
+    ref_base = ref_period[0] - start_year
+    ref_lim  = ref_period[1] - start_year + 1
+    s = series.reshape(-1, 12)
+    ref = s[ref_base:ref_lim]
+    ok = ~np.isnan(s)
+    ref_ok = ~np.isnan(ref)
+    n_ref, n_all = ref_ok.sum(axis=0), ok.sum(axis=0)
+    with np.errstate(all='ignore'):
+        mean = np.where(n_ref > 0,
+                        _seq_sum(np.where(ref_ok, ref, 0.0)) / n_ref,
+                        _seq_sum(np.where(ok, s, 0.0)) / n_all)
+    np.subtract(s, mean, out=s, where=ok)
+
+
+def _anomalize_loop(series, start_year, ref_period=REFERENCE_PERIOD):
     """Anomalize flat monthly array in-place.
 
     Matches gistemp4.0 series.anomalize() with NaN instead of MISSING.
@@ -98,117 +163,171 @@ def _anomalize(series, start_year, ref_period=REFERENCE_PERIOD):
         series[valid_i] -= mean
 
 
-def step3(df, start_year, end_year, radius=GRIDDING_RADIUS):
-    """Grid step2 station records into 8000 equal-area subboxes.
+def _grid_subboxes(mat, csr, lo, hi, radius, start_year, out):
+    """Combine the contributors of subboxes lo:hi into rows of *out*.
 
-    Input:  wide station DataFrame (step2 output).
-    Output: wide subbox DataFrame with columns:
-              lat_s, lat_n, lon_w, lon_e, n_stations, station_months, d,
-              {month}_{year} (monthly anomalies, NaN for empty/missing).
+    *mat* is the good_count-sorted station matrix and *csr* the (indptr,
+    idx, weights) of each subbox's contributors: rows of *mat*, ascending,
+    and their distance weights. Rows of *out* (out[0] is subbox lo) for
+    subboxes with no station are left as they are (NaN). Returns one
+    (n_stations, station_months, d) tuple per subbox.
     """
-    n_months = (end_year - start_year + 1) * 12
-
-    logger.info("  Building flat series matrix…")
-    mat = _build_flat_matrix(df, start_year, end_year)
+    indptr, idx, weights = csr
+    meta = []
 
-    lats = df['Latitude'].astype(float).values
-    lons = df['Longitude'].astype(float).values
-    pi180  = math.pi / 180.0
-    sn_lat = np.sin(lats * pi180)
-    cs_lat = np.cos(lats * pi180)
-    sn_lon = np.sin(lons * pi180)
-    cs_lon = np.cos(lons * pi180)
+    for k in range(lo, hi):
+        in_idx = idx[indptr[k]:indptr[k + 1]].tolist()
+        in_wt = weights[indptr[k]:indptr[k + 1]].tolist()
 
-    # Sort stations by good_count descending, stable to preserve original order on ties
-    good_counts = np.sum(~np.isnan(mat), axis=1)
-    order  = np.argsort(-good_counts, kind='stable')
-    mat    = mat[order]
-    sn_lat = sn_lat[order]
-    cs_lat = cs_lat[order]
-    sn_lon = sn_lon[order]
-    cs_lon = cs_lon[order]
+        if len(in_idx) == 0:
+            meta.append((0, 0, np.nan))
+            continue
 
-    arc     = radius / EARTH_RADIUS
-    cos_arc = math.cos(arc)
+        # Initialise composite with first contributor
+        wt0   = in_wt[0]
+        comp  = mat[in_idx[0]].copy()
+        cwt   = np.where(~np.isnan(comp), wt0, 0.0)
+        max_wt       = wt0
+        tot_stations = 1
+        tot_months   = int((~np.isnan(comp)).sum())
+
+        # Merge remaining contributors
+        for fi, wt in zip(in_idx[1:], in_wt[1:]):
+            cnt = _combine(comp, cwt, mat[fi], wt, MIN_OVERLAP)
+            n_merged = sum(cnt)
+            if n_merged > 0:
+                tot_stations += 1
+                tot_months   += n_merged
+                max_wt        = max(max_wt, wt)
+
+        _anomalize(comp, start_year)
+        out[k - lo] = comp
+        meta.append((tot_stations, tot_months, radius * (1.0 - max_wt)))
+
+    return meta
+
+
+def _grid_range(mat_spec, csr_specs, out_spec, lo, hi, radius, start_year):
+    """Worker: _grid_subboxes() for subboxes lo:hi, on the shared arrays."""
+    shms, arrays = zip(*(parallel.attach(spec) for spec in (mat_spec, *csr_specs, out_spec)))
+    mat, out = arrays[0], arrays[-1]
+    try:
+        return _grid_subboxes(mat, arrays[1:-1], lo, hi, radius, start_year, out[lo:hi])
+    finally:
+        del arrays, mat, out
+        for shm in shms:
+            shm.close()
+
+
+def _grid_parallel(mat, csr, n_subboxes, radius, start_year, workers):
+    """_grid_subboxes() for all subboxes on a process pool of *workers*.
+
+    The station matrix and contributor CSR go to the workers in shared
+    memory, and each worker writes its subboxes' rows straight into a
+    shared output array. Returns (data_mat, meta) in subbox order, as the
+    serial loop.
+    """
+    n_blocks = min(n_subboxes, workers * _BLOCKS_PER_WORKER)
+    bounds = np.linspace(0, n_subboxes, n_blocks + 1).astype(int)
+    shared = [parallel.SharedArray(a.shape, a.dtype) for a in (mat, *csr)]
+    try:
+        for sa, a in zip(shared, (mat, *csr)):
+            sa.array[...] = a
+        with parallel.SharedArray((n_subboxes, mat.shape[1]), np.float64, fill=np.nan) as so:
+            with parallel.pool(min(workers, n_blocks)) as pool:
+                jobs = [pool.submit(_grid_range, shared[0].spec,
+                                    [sa.spec for sa in shared[1:]], so.spec,
+                                    int(lo), int(hi), radius, start_year)
+                        for lo, hi in zip(bounds[:-1], bounds[1:])]
+                meta = [m for job in jobs for m in job.result()]
+            return so.array.copy(), meta
+    finally:
+        for sa in shared:
+            sa.release()
+
+
+def _grid_frame(mat, csr, subboxes, radius, start_year, end_year, workers):
+    """Grid the sorted station matrix *mat* into the step3 output frame,
+    with each subbox's contributors given by *csr*."""
+    n_months = (end_year - start_year + 1) * 12
+    n_subboxes = len(subboxes)
+
+    if workers > 1:
+        logger.info(f"  Gridding {n_subboxes} subboxes at {radius:g} km "
+                    f"on {workers} worker processes…")
+        data_mat, meta = _grid_parallel(mat, csr, n_subboxes, radius, start_year, workers)
+    else:
+        logger.info(f"  Gridding {n_subboxes} subboxes at {radius:g} km…")
+        data_mat = np.full((n_subboxes, n_months), np.nan, dtype=np.float64)
+        meta = _grid_subboxes(mat, csr, 0, n_subboxes, radius, start_year, data_mat)
+
+    meta_rows = [{'lat_s': subbox[0], 'lat_n': subbox[1],
+                  'lon_w': subbox[2], 'lon_e': subbox[3],
+                  'n_stations': n, 'station_months': months, 'd': d}
+                 for subbox, (n, months, d) in zip(subboxes, meta)]
+    n_empty = sum(1 for n, _, _ in meta if n == 0)
+    logger.info(f"  Step 3 complete: {n_subboxes} subboxes, {n_empty} empty")
 
-    # Pre-allocate output: one row per subbox
+    # Output: one row per subbox, in gridsub() order
     time_cols = [f'{m}_{y}'
                  for y in range(start_year, end_year + 1)
                  for m in range(1, 13)]
-    n_subboxes = 8000
-    data_mat   = np.full((n_subboxes, n_months), np.nan, dtype=np.float64)
-    meta_rows  = []
-
-    logger.info("  Gridding 8000 subboxes…")
-    sb_i   = 0
-    n_empty = 0
-
-    for _box, subbox_gen in eqarea.gridsub():
-        for subbox in subbox_gen:
-            clat, clon = eqarea.centre(subbox)
-
-            # Treat all polar subboxes as a single point (matches gistemp4.0)
-            if round(clat) >= 84:
-                clat, clon = 90.0, 0.0
-            elif round(clat) <= -84:
-                clat, clon = -90.0, 0.0
-
-            c_sn     = math.sin(clat * pi180)
-            c_cs     = math.cos(clat * pi180)
-            c_sn_lon = math.sin(clon * pi180)
-            c_cs_lon = math.cos(clon * pi180)
-
-            cosd   = (sn_lat * c_sn +
-                      cs_lat * c_cs * (cs_lon * c_cs_lon + sn_lon * c_sn_lon))
-            in_idx = np.where(cosd > cos_arc)[0]
-
-            meta = {'lat_s': subbox[0], 'lat_n': subbox[1],
-                    'lon_w': subbox[2], 'lon_e': subbox[3]}
-
-            if len(in_idx) == 0:
-                n_empty += 1
-                meta.update(n_stations=0, station_months=0, d=np.nan)
-                meta_rows.append(meta)
-                sb_i += 1
-                continue
-
-            # Distance weights: 1 - chord/arc
-            c_cosd  = cosd[in_idx]
-            chord   = np.sqrt(np.maximum(2.0 * (1.0 - c_cosd), 0.0))
-            weights = 1.0 - chord / arc
-
-            # Initialise composite with first contributor
-            fi0   = in_idx[0]
-            wt0   = float(weights[0])
-            comp  = mat[fi0].copy()
-            cwt   = np.where(~np.isnan(comp), wt0, 0.0)
-            max_wt       = wt0
-            tot_stations = 1
-            tot_months   = int((~np.isnan(comp)).sum())
-
-            # Merge remaining contributors
-            for j in range(1, len(in_idx)):
-                fi  = in_idx[j]
-                wt  = float(weights[j])
-                cnt = _combine(comp, cwt, mat[fi], wt, MIN_OVERLAP)
-                n_merged = sum(cnt)
-                if n_merged > 0:
-                    tot_stations += 1
-                    tot_months   += n_merged
-                    max_wt        = max(max_wt, wt)
-
-            _anomalize(comp, start_year)
-            data_mat[sb_i] = comp
-
-            meta.update(n_stations=tot_stations, station_months=tot_months,
-                        d=radius * (1.0 - max_wt))
-            meta_rows.append(meta)
-            sb_i += 1
-
-    logger.info(f"  Step 3 complete: {n_subboxes} subboxes, {n_empty} empty")
-
     df_meta = pd.DataFrame(meta_rows)
     df_time = pd.DataFrame(data_mat, columns=time_cols)
     df_out  = pd.concat([df_meta, df_time], axis=1)
     df_out.index.name = 'subbox_id'
     return df_out
+
+
+def step3(df, start_year, end_year, radius=GRIDDING_RADIUS, inv=None, workers=1):
+    """Grid step2 station records into 8000 equal-area subboxes.
+
+    Input:  wide station DataFrame (step2 output). Station sines/cosines are
+            taken from the inventory *inv* when given (utils/inventory.py),
+            else computed from the Latitude/Longitude columns. With *inv*
+            the station → subbox weights come from the cache when built
+            for the same v4.inv and radius (utils/gridweights.py).
+            *radius* may be a sequence of radii (e.g. (1200, 250)): the
+            stations are sorted and their distances computed once, for the
+            largest, and each smaller radius's contributors and weights are
+            cut from those.
+            With *workers* > 1 the subboxes are gridded on a process pool
+            (bit-identical to the serial run).
+    Output: wide subbox DataFrame with columns:
+              lat_s, lat_n, lon_w, lon_e, n_stations, station_months, d,
+              {month}_{year} (monthly anomalies, NaN for empty/missing);
+            for a sequence of radii, a dict {radius: DataFrame}, each frame
+            identical to a step3() call with that radius alone.
+    """
+    radii = list(radius) if np.ndim(radius) else [radius]
+    if not radii:
+        raise ValueError("step3: no gridding radius given")
+    largest = max(radii)
+
+    logger.info("  Building flat series matrix…")
+    mat = _build_flat_matrix(df, start_year, end_year)
+
+    # Sort stations by good_count descending, stable to preserve original order on ties
+    good_counts = np.sum(~np.isnan(mat), axis=1)
+    order = np.argsort(-good_counts, kind='stable')
+    mat   = mat[order]
+
+    if inv is not None:
+        weights = gridweights.load(inv, largest)
+        columns = inv.locate(df.index)[order]
+    else:
+        pi180 = math.pi / 180.0
+        lats = df['Latitude'].astype(float).values[order]
+        lons = df['Longitude'].astype(float).values[order]
+        weights = gridweights.build(np.sin(lats * pi180), np.cos(lats * pi180),
+                                    np.sin(lons * pi180), np.cos(lons * pi180), largest)
+        columns = None
+
+    subboxes = gridweights.subboxes()
+    out = {}
+    for r in radii:
+        w = weights if r == largest else weights.within(r)
+        # Each subbox's contributors as rows of the sorted matrix, ascending.
+        csr = w.select(columns) if columns is not None else (w.indptr, w.indices, w.weights)
+        out[r] = _grid_frame(mat, csr, subboxes, float(r), start_year, end_year, workers)
+    return out if np.ndim(radius) else out[radius]
@@ -19,7 +19,7 @@ import struct
 import numpy as np
 import pandas as pd
 
-from utils import sbbx
+from utils import inputs, sbbx
 from utils.logger import logger
 from utils.config import SBBX_URL, INPUT_DIR
 
@@ -64,7 +64,7 @@ def _load_monthlies(entries):
     dates = []
     for yr, mo, path in entries:
         dates.append((yr, mo))
-        with open(path, 'rb') as f:
+        with inputs.open_binary(path) as f:
             # Two Fortran records; data is in the second
             r1_len = struct.unpack(_BOS + 'i', f.read(4))[0]
             f.read(r1_len); f.read(4)
@@ -118,7 +118,7 @@ def _merge_monthlies(df_ocean, sst, dates, first_yr, start_year):
 
 def _sbbx_end_date(path):
     """Parse end year/month from SBBX title string."""
-    with open(path, 'rb') as f:
+    with inputs.open_binary(path) as f:
         length = struct.unpack(_BOS + 'i', f.read(4))[0]
         hdr    = f.read(length)
     title = hdr[32:112].decode('utf-8')
@@ -142,17 +142,14 @@ def step4(sbbx_path, start_year, end_year, input_dir=None):
     -------
     DataFrame with 8000 rows in the same format as step3 output.
     """
-    if not os.path.exists(sbbx_path):
-        import gzip, shutil, urllib.request
-        gz_path = sbbx_path + '.gz'
+    # The download is kept gzipped; sbbx.read() streams it.
+    if inputs.resolve(sbbx_path) is None:
+        import urllib.request
         logger.info(f"  Downloading SBBX.ERSSTv5 …")
         os.makedirs(INPUT_DIR, exist_ok=True)
-        urllib.request.urlretrieve(SBBX_URL, gz_path)
-        with gzip.open(gz_path, 'rb') as f_in, open(sbbx_path, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
-        os.remove(gz_path)
+        urllib.request.urlretrieve(SBBX_URL, sbbx_path + '.gz')
 
-    logger.info(f"  Reading SBBX ocean file: {os.path.basename(sbbx_path)}")
+    logger.info(f"  Reading SBBX ocean file: {os.path.basename(inputs.resolve(sbbx_path))}")
     df_ocean = sbbx.read(sbbx_path, start_year, end_year)
 
     # Check for monthlies that extend beyond the SBBX file's last record
@@ -0,0 +1,115 @@
+"""
+Benchmark step0 GHCN parsing.
+
+  1. vectorised byte-level reader (with year-range pushdown) vs pd.read_fwf
+     followed by a year filter; checks both give the same df_temps /
+     last_ghcn_year pair.
+  2. step0 followed by step1 vs the fused step0(..., drop_rules=) pass;
+     checks both give the identical step1 frame.
+  3. GHCN cube build with 1/2/4/8 worker processes; checks every parallel
+     build is identical to the serial one.
+
+Uses input/ghcnm.tavg.qcf.dat, v4.inv and Ts.strange.v4.list.IN_full (run
+the pipeline once to download them).
+
+Run from repo root:
+    python testing/bench_step0.py
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.config import INPUT_DIR, START_YEAR, END_YEAR
+from utils.config import GHCN_TEMP_URL, GHCN_META_URL, STRANGE_URL
+from steps import step0, step1
+from utils import ghcn
+
+GHCN_PATH = os.path.join(INPUT_DIR, 'ghcnm.tavg.qcf.dat')
+
+
+def _filter(df, start_year, end_year):
+    """Post-parse year filter (the pd.read_fwf path)."""
+    df = df[(df["Year"] >= start_year) & (df["Year"] <= end_year)]
+    return df.reset_index(drop=True)
+
+
+def _temps(df):
+    """-9999 → NaN and last GHCN year, as in step0._fetch_ghcn_temps."""
+    df = df.copy()
+    last_ghcn_year = df.groupby("Station_ID")["Year"].max()
+    month_cols = [str(m) for m in range(1, 13)]
+    df[month_cols] = df[month_cols].replace(-9999, np.nan) / 100.0
+    return df, last_ghcn_year
+
+
+def _time(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--start_year', type=int, default=START_YEAR)
+    parser.add_argument('--end_year', type=int, default=END_YEAR)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    sy, ey = args.start_year, args.end_year
+
+    if not os.path.exists(GHCN_PATH):
+        sys.exit(f"{GHCN_PATH} not found — run the pipeline once to download it.")
+    size_mb = os.path.getsize(GHCN_PATH) / 1e6
+    print(f"=== step0 GHCN parse benchmark ({size_mb:.0f} MB, {sy}–{ey}) ===\n")
+
+    t_fwf, (df_a, last_a) = _time(
+        lambda: _temps(_filter(step0._read_ghcn_fwf(GHCN_PATH), sy, ey)), args.repeat)
+    print(f"  pd.read_fwf + filter : {t_fwf:8.3f} s")
+
+    t_vec, (df_b, last_b) = _time(
+        lambda: _temps(step0._read_ghcn(GHCN_PATH, sy, ey)), args.repeat)
+    print(f"  vectorised + pushdown: {t_vec:8.3f} s   ({t_fwf / t_vec:.1f}× faster)")
+
+    pd.testing.assert_frame_equal(df_a, df_b)
+    pd.testing.assert_series_equal(last_a, last_b)
+    print("\n  ✓ df_temps and last_ghcn_year are identical.")
+
+    print("\n── step0 + step1 vs fused pass ──────────────────────────────────")
+    rules = step1.load_rules(STRANGE_URL, sy, ey)
+    t_sep, df_sep = _time(lambda: step1.step1(
+        step0.step0(GHCN_TEMP_URL, GHCN_META_URL, sy, ey), STRANGE_URL, sy, ey), args.repeat)
+    print(f"  step0 then step1     : {t_sep:8.3f} s")
+    t_fused, df_fused = _time(lambda: step0.step0(
+        GHCN_TEMP_URL, GHCN_META_URL, sy, ey, drop_rules=rules), args.repeat)
+    print(f"  fused                : {t_fused:8.3f} s   ({t_sep / t_fused:.1f}× faster)")
+    pd.testing.assert_frame_equal(df_sep, df_fused, check_exact=True)
+    print("\n  ✓ Fused output is identical to step1(step0(...)).")
+
+    print(f"\n── Cube build scaling (logical CPUs: {os.cpu_count()}) ──────────────")
+    serial = None
+    t_one = None
+    for workers in args.workers:
+        t, cube = _time(lambda: ghcn.build_cube(GHCN_PATH, workers), args.repeat)
+        t_one = t_one or t
+        print(f"  workers={workers:<3d}: {t:8.3f} s   (speed-up {t_one / t:.2f}×)")
+        if serial is None:
+            serial = cube
+            continue
+        for name in ('ids', 'values', 'present', 'last_year', 'first_year'):
+            assert np.array_equal(getattr(serial, name), getattr(cube, name)), name
+    print("\n  ✓ Parallel cubes are identical to the first build.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark step2.
+
+  1. prefix-sum knee search (_getfit) vs a _trend2 call per knee
+     (_getfit(exact=True)) on random-walk difference series; checks both
+     pick the same fit.
+  2. step2 (drop_short_records + urban adjustment) on the step1 output with
+     1/2/4/8 workers; checks every parallel run gives a frame identical to
+     the serial one.
+
+Uses the cached step1 output if present, otherwise builds it from
+input/ghcnm.tavg.qcf.dat, v4.inv and Ts.strange.v4.list.IN_full (run the
+pipeline once to download them).
+
+Run from repo root:
+    python testing/bench_step2.py
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.config import START_YEAR, END_YEAR
+from utils.config import GHCN_TEMP_URL, GHCN_META_URL, STRANGE_URL, BRIGHTNESS_URL
+from steps import step0, step1, step2
+from utils import cache as step_cache
+from utils import inventory
+
+
+def _time(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _random_points(rng, n_series):
+    """(years, diffs) series like _prepare_series() gives: ascending years."""
+    out = []
+    for _ in range(n_series):
+        n = int(rng.integers(20, 140))
+        years = np.sort(rng.choice(np.arange(1880, 1880 + 2 * n), n, replace=False))
+        diffs = np.round(np.cumsum(rng.normal(scale=0.1, size=n)), 2)
+        out.append((years.astype(np.int64), diffs))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--start_year', type=int, default=START_YEAR)
+    parser.add_argument('--end_year', type=int, default=END_YEAR)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--fits', type=int, default=2000)
+    args = parser.parse_args()
+    sy, ey = args.start_year, args.end_year
+
+    print(f"=== step2 knee search ({args.fits} random series) ===\n")
+    series = _random_points(np.random.default_rng(0), args.fits)
+    t_loop, fits_a = _time(lambda: [step2._getfit(*p, exact=True) for p in series], args.repeat)
+    print(f"  _trend2 per knee     : {t_loop:8.3f} s")
+    t_pre, fits_b = _time(lambda: [step2._getfit(*p) for p in series], args.repeat)
+    print(f"  prefix sums          : {t_pre:8.3f} s   ({t_loop / t_pre:.1f}× faster)")
+    assert fits_a == fits_b
+    print("\n  ✓ Both searches give identical fits.")
+
+    inv = inventory.fetch(GHCN_META_URL)
+    df1 = step_cache.load('step1', sy, ey)
+    if df1 is None:
+        df1 = step1.step1(step0.step0(GHCN_TEMP_URL, GHCN_META_URL, sy, ey, inv=inv),
+                          STRANGE_URL, sy, ey)
+
+    print(f"\n=== step2 scaling ({len(df1)} stations, {sy}–{ey}, "
+          f"logical CPUs: {os.cpu_count()}) ===\n")
+    serial = None
+    t_one = None
+    for workers in args.workers:
+        t, df2 = _time(lambda: step2.step2(df1, GHCN_META_URL, BRIGHTNESS_URL, sy, ey,
+                                           inv=inv, workers=workers), args.repeat)
+        t_one = t_one or t
+        print(f"  workers={workers:<3d}: {t:8.3f} s   (speed-up {t_one / t:.2f}×)")
+        if serial is None:
+            serial = df2
+            continue
+        pd.testing.assert_frame_equal(serial, df2, check_exact=True)
+    print("\n  ✓ Parallel step2 outputs are identical to the first run.")
+
+
+if __name__ == '__main__':
+    main()
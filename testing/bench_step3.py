@@ -0,0 +1,86 @@
+"""
+Benchmark step3 subbox gridding.
+
+  1. step3 on the step2 output with 1/2/4/8 workers; checks every parallel
+     run gives a frame identical to the serial one.
+  2. one multi-radius step3 call (1200 and 250 km by default) against a
+     step3 call per radius; checks the frames are identical.
+
+Uses the cached step2 output if present, otherwise builds it from the
+inputs in input/ (run the pipeline once to download them).
+
+Run from repo root:
+    python testing/bench_step3.py
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.config import START_YEAR, END_YEAR
+from utils.config import GHCN_TEMP_URL, GHCN_META_URL, STRANGE_URL, BRIGHTNESS_URL
+from steps import step0, step1, step2, step3
+from utils import cache as step_cache
+from utils import inventory
+
+
+def _time(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--start_year', type=int, default=START_YEAR)
+    parser.add_argument('--end_year', type=int, default=END_YEAR)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--radii', type=float, nargs='+', default=[1200.0, 250.0])
+    args = parser.parse_args()
+    sy, ey = args.start_year, args.end_year
+
+    inv = inventory.fetch(GHCN_META_URL)
+    df2 = step_cache.load('step2', sy, ey)
+    if df2 is None:
+        df1 = step1.step1(step0.step0(GHCN_TEMP_URL, GHCN_META_URL, sy, ey, inv=inv),
+                          STRANGE_URL, sy, ey)
+        df2 = step2.step2(df1, GHCN_META_URL, BRIGHTNESS_URL, sy, ey, inv=inv)
+
+    print(f"\n=== step3 scaling ({len(df2)} stations, {sy}–{ey}, "
+          f"logical CPUs: {os.cpu_count()}) ===\n")
+    serial = None
+    t_one = None
+    for workers in args.workers:
+        t, df3 = _time(lambda: step3.step3(df2, sy, ey, inv=inv, workers=workers), args.repeat)
+        t_one = t_one or t
+        print(f"  workers={workers:<3d}: {t:8.3f} s   (speed-up {t_one / t:.2f}×)")
+        if serial is None:
+            serial = df3
+            continue
+        pd.testing.assert_frame_equal(serial, df3, check_exact=True)
+    print("\n  ✓ Parallel step3 outputs are identical to the first run.")
+
+    print(f"\n=== step3 radii {', '.join(f'{r:g}' for r in args.radii)} km ===\n")
+    t_sep, separate = _time(lambda: {r: step3.step3(df2, sy, ey, radius=r, inv=inv)
+                                     for r in args.radii}, args.repeat)
+    print(f"  one call per radius  : {t_sep:8.3f} s")
+    t_one, frames = _time(lambda: step3.step3(df2, sy, ey, radius=args.radii, inv=inv),
+                          args.repeat)
+    print(f"  single multi-radius  : {t_one:8.3f} s   ({t_sep / t_one:.2f}× faster)")
+    for r in args.radii:
+        pd.testing.assert_frame_equal(separate[r], frames[r], check_exact=True)
+    print("\n  ✓ Multi-radius frames are identical to the per-radius runs.")
+
+
+if __name__ == '__main__':
+    main()
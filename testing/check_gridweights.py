@@ -0,0 +1,79 @@
+"""
+Check the station → subbox weight matrix (utils/gridweights.py).
+
+  1. The matrix built for v4.inv matches a brute-force scan of every
+     station against every subbox centre (same cosd expression, same
+     cos(arc) cut-off), entry for entry and bit for bit.
+  2. The cached copy load() returns equals a fresh build().
+  3. within() at smaller radii equals build() at those radii.
+  4. stations() and subboxes() agree with each other.
+
+Run from repo root (after running the pipeline once, for v4.inv):
+    python testing/check_gridweights.py [--radius KM] [--smaller KM ...]
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.config import GHCN_META_URL
+from utils import gridweights, inventory
+
+
+def _same(a, b):
+    return (np.array_equal(a.indptr, b.indptr) and np.array_equal(a.indices, b.indices)
+            and np.array_equal(a.cosd.view(np.uint64), b.cosd.view(np.uint64))
+            and np.array_equal(a.weights.view(np.uint64), b.weights.view(np.uint64)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--radius', type=float, default=1200.0)
+    parser.add_argument('--smaller', type=float, nargs='+', default=[250.0, 500.0, 1000.0])
+    args = parser.parse_args()
+
+    inv = inventory.fetch(GHCN_META_URL)
+    t0 = time.perf_counter()
+    built = gridweights.build(inv.snlat, inv.cslat, inv.snlon, inv.cslon, args.radius)
+    print(f"  build : {time.perf_counter() - t0:7.3f} s  "
+          f"({built.shape[0]}×{built.shape[1]}, {len(built.indices)} entries)")
+
+    cos_crit = math.cos(args.radius / gridweights.EARTH_RADIUS)
+    for k, (c_sn, c_cs, c_sn_lon, c_cs_lon) in enumerate(gridweights.centres().T.tolist()):
+        cosd = inv.snlat * c_sn + inv.cslat * c_cs * (inv.cslon * c_cs_lon + inv.snlon * c_sn_lon)
+        hit = np.flatnonzero(cosd > cos_crit)
+        idx, _ = built.row(k)
+        assert np.array_equal(idx, hit), k
+        assert np.array_equal(built.cosd[built.indptr[k]:built.indptr[k + 1]], cosd[hit]), k
+    print("  ✓ Matches a brute-force scan of every subbox.")
+
+    t0 = time.perf_counter()
+    loaded = gridweights.load(inv, args.radius)
+    print(f"  load  : {time.perf_counter() - t0:7.3f} s")
+    assert _same(built, loaded)
+    print("  ✓ load() equals build().")
+
+    for radius in args.smaller:
+        assert _same(built.within(radius),
+                     gridweights.build(inv.snlat, inv.cslat, inv.snlon, inv.cslon, radius))
+    print(f"  ✓ within() equals build() at {', '.join(f'{r:g}' for r in args.smaller)} km.")
+
+    rng = np.random.default_rng(0)
+    for station in rng.choice(inv.ids, min(50, len(inv)), replace=False).astype(str):
+        rows, weights = loaded.subboxes(station)
+        for k, w in zip(rows.tolist(), weights.tolist()):
+            _, wt = loaded.row(k)
+            assert station in loaded.stations(k)
+            assert w in wt.tolist()
+    print("  ✓ stations() and subboxes() agree.")
+
+
+if __name__ == '__main__':
+    main()
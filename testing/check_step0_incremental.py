@@ -0,0 +1,109 @@
+"""
+Check the incremental step0 path (step0.update) against a full rebuild.
+
+Starting from input/ghcnm.tavg.qcf.dat, each round writes a new synthetic
+GHCN release the way NOAA revises one: a few records get revised values,
+one station disappears entirely and one new station appears, all in the
+same release. step0.update() on the previous output and state must give
+exactly the frame (values, dtypes and all) a fresh step0() gives on the new
+release, and report the removed and added stations as changed.
+
+The releases are written to a temporary directory; input/ is only read.
+Needs input/ghcnm.tavg.qcf.dat and v4.inv (run the pipeline once to
+download them).
+
+Run from repo root:
+    python testing/check_step0_incremental.py [--rounds N] [--revise N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.config import INPUT_DIR, START_YEAR, END_YEAR
+from utils.config import GHCN_TEMP_URL, GHCN_META_URL
+from steps import step0
+from utils import inputs, inventory
+
+
+def _release(lines, rng, inv_ids, n_revise):
+    """(lines, removed_id, added_id): *lines* with n_revise records revised,
+    every record of one station removed and a copy of another station's
+    records added under a new ID (from the inventory where one is free)."""
+    lines = list(lines)
+    ids = sorted({line[:11] for line in lines})
+    for k in rng.choice(len(lines), min(n_revise, len(lines)), replace=False):
+        line = lines[k]
+        month = int(rng.integers(12))
+        a = 19 + 8 * month
+        lines[k] = line[:a] + f"{int(rng.integers(-3000, 4000)):5d}" + line[a + 5:]
+
+    removed, source = rng.choice(ids, 2, replace=False)
+    free = sorted(set(inv_ids) - set(ids))
+    added = free[int(rng.integers(len(free)))] if free else f"ZZ{int(rng.integers(10**9)):09d}"
+    copied = [added + line[11:] for line in lines if line[:11] == source]
+    lines = [line for line in lines if line[:11] != removed] + copied
+    return sorted(lines), removed, added
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--start_year', type=int, default=START_YEAR)
+    parser.add_argument('--end_year', type=int, default=END_YEAR)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--revise', type=int, default=50,
+                        help="records to revise per release")
+    args = parser.parse_args()
+    sy, ey = args.start_year, args.end_year
+
+    inv = inventory.fetch(GHCN_META_URL)
+    with inputs.open_text(os.path.join(INPUT_DIR, 'ghcnm.tavg.qcf.dat')) as f:
+        lines = f.read().splitlines()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        # step0 reads its GHCN file from INPUT_DIR; point it at the releases.
+        step0.INPUT_DIR = tmp
+        path = os.path.join(tmp, 'ghcnm.tavg.qcf.dat')
+
+        def write(release):
+            with open(path, 'w') as f:
+                f.write('\n'.join(release) + '\n')
+
+        write(lines)
+        df = step0.step0(GHCN_TEMP_URL, GHCN_META_URL, sy, ey, inv=inv)
+        state = step0.ingest_state(GHCN_TEMP_URL, sy, ey)
+        inv_ids = inv.ids.astype(str).tolist()
+
+        for round_no in range(1, args.rounds + 1):
+            lines, removed, added = _release(lines, rng, inv_ids, args.revise)
+            write(lines)
+
+            prev_ids = set(df.index)
+            t0 = time.perf_counter()
+            df_inc, changed, state = step0.update(df.copy(), state, GHCN_TEMP_URL,
+                                                  GHCN_META_URL, sy, ey, inv=inv)
+            t_inc = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            df = step0.step0(GHCN_TEMP_URL, GHCN_META_URL, sy, ey, inv=inv)
+            t_full = time.perf_counter() - t0
+
+            pd.testing.assert_frame_equal(df, df_inc, check_exact=True)
+            assert removed not in prev_ids or removed in changed, removed
+            assert added not in set(df.index) or added in changed, added
+            print(f"  round {round_no}: -{removed} +{added}, {len(changed)} changed; "
+                  f"update {t_inc:6.2f} s, full {t_full:6.2f} s  ✓ identical")
+
+    print("\n  ✓ Incremental step0 matches a full rebuild.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Check the incremental step2 path (step2.update) against a full recompute.
+
+Runs step2.update() on the step1 output to get a state, then perturbs the
+step1 output the way a new GHCN release would: some stations get revised
+values, some gain a month, some disappear. It also flips the recorded
+rural/urban status of a few stations in the state. update() on the
+perturbed frame with the earlier state must give exactly the frame step2()
+gives from scratch, and the same state as update() without one.
+
+Uses the cached step1 output if present, otherwise builds it from
+input/ghcnm.tavg.qcf.dat, v4.inv and Ts.strange.v4.list.IN_full (run the
+pipeline once to download them).
+
+Run from repo root:
+    python testing/check_step2_incremental.py
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.config import START_YEAR, END_YEAR
+from utils.config import GHCN_TEMP_URL, GHCN_META_URL, STRANGE_URL, BRIGHTNESS_URL
+from steps import step0, step1, step2
+from utils import cache as step_cache
+from utils import frames, inventory
+
+
+def _perturb(df, rng, n_stations):
+    """A copy of *df* with n_stations revised, n_stations gaining a value in
+    an empty month and n_stations // 4 removed."""
+    df = df.copy()
+    tc = frames.time_cols(df)
+    values = df[tc].to_numpy(copy=True)
+    rows = rng.choice(len(df), 2 * n_stations, replace=False)
+    for r in rows[:n_stations]:
+        present = np.flatnonzero(~np.isnan(values[r]))
+        if len(present):
+            values[r, rng.choice(present, min(3, len(present)), replace=False)] += 0.3
+    for r in rows[n_stations:]:
+        empty = np.flatnonzero(np.isnan(values[r]))
+        if len(empty):
+            values[r, rng.choice(empty)] = round(float(rng.normal(10, 5)), 2)
+    df[tc] = values
+    gone = rng.choice(len(df), max(1, n_stations // 4), replace=False)
+    return df.drop(df.index[gone])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--start_year', type=int, default=START_YEAR)
+    parser.add_argument('--end_year', type=int, default=END_YEAR)
+    parser.add_argument('--stations', type=int, default=10,
+                        help="stations to revise, and to extend, per round")
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    sy, ey = args.start_year, args.end_year
+
+    inv = inventory.fetch(GHCN_META_URL)
+    df1 = step_cache.load('step1', sy, ey)
+    if df1 is None:
+        df1 = step1.step1(step0.step0(GHCN_TEMP_URL, GHCN_META_URL, sy, ey, inv=inv),
+                          STRANGE_URL, sy, ey)
+
+    _, state = step2.update(df1, None, GHCN_META_URL, BRIGHTNESS_URL, sy, ey, inv=inv)
+    rng = np.random.default_rng(0)
+    for round_no in range(1, args.rounds + 1):
+        df_new = _perturb(df1, rng, args.stations)
+        state = dict(state)
+        flip = rng.choice(len(state['rural']), min(3, len(state['rural'])), replace=False)
+        state['rural'] = state['rural'].copy()
+        state['rural'][flip] = ~state['rural'][flip]
+
+        t0 = time.perf_counter()
+        df_inc, state_inc = step2.update(df_new, state, GHCN_META_URL, BRIGHTNESS_URL,
+                                         sy, ey, inv=inv)
+        t_inc = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        df_full = step2.step2(df_new, GHCN_META_URL, BRIGHTNESS_URL, sy, ey, inv=inv)
+        t_full = time.perf_counter() - t0
+        _, state_full = step2.update(df_new, None, GHCN_META_URL, BRIGHTNESS_URL,
+                                     sy, ey, inv=inv)
+
+        pd.testing.assert_frame_equal(df_full, df_inc, check_exact=True)
+        assert state_inc.keys() == state_full.keys()
+        for name in state_full:
+            assert np.array_equal(state_inc[name], state_full[name]), name
+        print(f"  round {round_no}: incremental {t_inc:6.2f} s, full {t_full:6.2f} s  ✓ identical")
+        df1, state = df_new, state_inc
+
+    print("\n  ✓ Incremental step2 matches a full recompute.")
+
+
+if __name__ == '__main__':
+    main()
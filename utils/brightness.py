@@ -0,0 +1,215 @@
+"""
+Night-light brightness grid (wrld-rad.data.txt) as a dense raster.
+
+File layout
+-----------
+One cell per line: "i j value", whitespace separated, on the 30" grid used
+by gistemp4.0's generate_brightness: i = 1..43200 west to east, j =
+1..21600 north to south. Cells that are not listed have brightness 0.
+
+The text file is converted once into a (21601, 43201) array indexed
+[j, i], stored next to it as <file>.npy and opened with mmap_mode='r', so a
+station lookup is a single fancy-index instead of a dict of the whole file.
+The dtype is the smallest of uint8 / uint16 / int32 / int64 that holds
+every value.
+The raster is rebuilt when the text file changes (see cache.is_current()).
+
+Lookups reproduce generate_brightness exactly: a cell is found only when
+its i/j tokens are the canonical decimal spelling of the index (the old
+code matched str(si), str(sj) against the raw tokens), a later line for
+the same cell wins, and a value that is not an integer reads as 0.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from utils import inputs
+from utils.cache import file_digest, is_current, source_stat
+
+SHAPE = (21601, 43201)                  # [j, i]; index 0 unused in i
+
+_CHUNK_BYTES = 1 << 24
+_DTYPES = (np.uint8, np.uint16, np.int32, np.int64)
+_SPACE = np.zeros(256, dtype=bool)
+_SPACE[list(b' \t\n\r\x0b\x0c')] = True
+_POW10 = 10 ** np.arange(19, dtype=np.int64)
+
+
+def cells(lat, lon):
+    """(sj, si) grid cell of each station (generate_brightness rounding)."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    # np.rint rounds half to even, like Python's round()
+    si = np.rint((lon + 180.0) * 120 + 1).astype(np.int64)
+    sj = np.rint(21600 + 0.5 - (lat + 90.0) * 120).astype(np.int64)
+    sj[sj >= 21600] = 21600
+    si[si >= 43200] = 1
+    return sj, si
+
+
+def lookup(raster, lat, lon) -> np.ndarray:
+    """int64 brightness of every (lat, lon); lat/lon must not be NaN."""
+    sj, si = cells(lat, lon)
+    out = np.zeros(len(sj), dtype=np.int64)
+    inside = (sj >= 0) & (si >= 0) & (si < SHAPE[1])
+    out[inside] = raster[sj[inside], si[inside]]
+    return out
+
+
+# ── Conversion ───────────────────────────────────────────────────────────────
+
+def _parse_fast(buf):
+    """(j, i, value) int64 arrays for a chunk of whole lines, or None when
+    the chunk needs the line-by-line parser: a line without exactly three
+    tokens, or a token that is not a canonical unsigned integer.
+
+    Tokens are decoded straight from the bytes: digit d at k places from
+    the end of its token contributes d * 10**k, summed per token.
+    """
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    empty = np.empty(0, dtype=np.int64)
+    if not len(arr):
+        return empty, empty, empty
+    space = _SPACE[arr]
+    start = ~space
+    start[1:] &= space[:-1]
+    line = np.cumsum(arr == 10)
+    counts = np.bincount(line[start])
+    if not np.all((counts == 0) | (counts == 3)):
+        return None
+    body = np.flatnonzero(~space)
+    if not len(body):
+        return empty, empty, empty
+    digits = arr[body].astype(np.int64) - 48
+    if digits.min() < 0 or digits.max() > 9:
+        return None
+
+    first = np.flatnonzero(start)                       # token start offsets
+    token = np.cumsum(start)[body] - 1                  # token of each byte
+    length = np.bincount(token, minlength=len(first))
+    if length.max() > 18 or np.any((arr[first] == 48) & (length > 1)):
+        return None                                     # overflow / leading zero
+    last = first + length - 1
+    values = np.add.reduceat(digits * _POW10[last[token] - body],
+                             np.cumsum(length) - length).reshape(-1, 3)
+    return values[:, 1], values[:, 0], values[:, 2]
+
+
+def _parse_slow(buf):
+    """_parse_fast() for any chunk: the original str.split() semantics."""
+    j, i, v = [], [], []
+    text = buf.decode('utf-8', errors='replace')
+    for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        try:
+            ii, jj = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        if str(ii) != parts[0] or str(jj) != parts[1]:
+            continue                                # never matched a lookup
+        try:
+            value = int(parts[2])
+        except ValueError:
+            value = 0
+        j.append(jj)
+        i.append(ii)
+        v.append(value)
+    return (np.array(j, dtype=np.int64), np.array(i, dtype=np.int64),
+            np.array(v, dtype=np.int64))
+
+
+def _chunks(path):
+    """Yield the file's bytes in chunks that end on a line boundary."""
+    with inputs.open_binary(path) as f:
+        rest = b''
+        while True:
+            block = f.read(_CHUNK_BYTES)
+            if not block:
+                if rest:
+                    yield rest
+                return
+            block = rest + block
+            cut = block.rfind(b'\n') + 1
+            if cut == 0:
+                rest = block
+                continue
+            yield block[:cut]
+            rest = block[cut:]
+
+
+def _widen(raster, path, dtype):
+    """Copy *raster* into a new memmap of *dtype* at *path*."""
+    tmp = path + '.widen'
+    wider = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=SHAPE)
+    for row in range(0, SHAPE[0], 1024):
+        wider[row:row + 1024] = raster[row:row + 1024]
+    wider.flush()
+    del raster, wider
+    os.replace(tmp, path)
+    return np.lib.format.open_memmap(path, mode='r+')
+
+
+def build_raster(path, out_path):
+    """Convert the brightness text file at *path* into a raster at *out_path*."""
+    raster = np.lib.format.open_memmap(out_path, mode='w+', dtype=_DTYPES[0], shape=SHAPE)
+    level = 0
+    for buf in _chunks(path):
+        parsed = _parse_fast(buf)
+        j, i, v = parsed if parsed is not None else _parse_slow(buf)
+        inside = (j >= 0) & (j < SHAPE[0]) & (i >= 0) & (i < SHAPE[1])
+        j, i, v = j[inside], i[inside], v[inside]
+        if not len(v):
+            continue
+        # A later line for the same cell wins (files in grid order skip this)
+        flat = j * SHAPE[1] + i
+        if np.any(flat[1:] <= flat[:-1]):
+            _, last = np.unique(flat[::-1], return_index=True)
+            keep = len(flat) - 1 - last
+            j, i, v = j[keep], i[keep], v[keep]
+        lo, hi = int(v.min()), int(v.max())
+        while not (np.iinfo(_DTYPES[level]).min <= lo and hi <= np.iinfo(_DTYPES[level]).max):
+            level += 1
+            raster = _widen(raster, out_path, _DTYPES[level])
+        raster[j, i] = v
+    raster.flush()
+    del raster
+
+
+def _raster_path(path):
+    return path + '.npy'
+
+
+def stamp(path):
+    """Size/mtime/SHA-256 of the brightness file the current raster was built
+    from (cache.is_current() format); builds the raster if needed."""
+    open_raster(path)
+    with open(_raster_path(inputs.resolve(path) or path) + '.json') as f:
+        return json.load(f)
+
+
+def open_raster(path):
+    """Read-only memmap of the raster for the brightness file at *path*,
+    (re)building it if stale. *path* may also resolve to a .gz/.xz copy."""
+    path = inputs.resolve(path) or path
+    out_path, meta_path = _raster_path(path), _raster_path(path) + '.json'
+    meta = None
+    if os.path.exists(meta_path) and os.path.exists(out_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        mtime_ns = meta.get('mtime_ns')
+        if not is_current(meta, path):
+            meta = None
+        elif meta['mtime_ns'] != mtime_ns:
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+    if meta is None:
+        tmp = out_path + '.tmp.npy'
+        build_raster(path, tmp)
+        os.replace(tmp, out_path)
+        with open(meta_path, 'w') as f:
+            json.dump(dict(source_stat(path), sha256=file_digest(path)), f)
+    return np.load(out_path, mmap_mode='r')
@@ -7,9 +7,16 @@ Usage:
     if df is None:
         df = run_step0(...)
         step_cache.save(df, 'step0', start_year, end_year)
+
+Auxiliary state that is not a DataFrame (e.g. step0's per-record hashes)
+is kept the same way as a dict of NumPy arrays with save_arrays/load_arrays;
+state that does not depend on the year range omits the years.
 """
 
+import hashlib
 import os
+
+import numpy as np
 import pandas as pd
 
 _CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache')
@@ -33,9 +40,62 @@ def save(df: pd.DataFrame, name: str, start_year: int, end_year: int) -> str:
     return path
 
 
+def _array_path(name: str, start_year, end_year) -> str:
+    if start_year is None:
+        return os.path.join(_CACHE_DIR, f'{name}.npz')
+    return os.path.join(_CACHE_DIR, f'{name}_{start_year}_{end_year}.npz')
+
+
+def load_arrays(name: str, start_year: int = None, end_year: int = None):
+    path = _array_path(name, start_year, end_year)
+    if os.path.exists(path):
+        with np.load(path) as npz:
+            return {k: npz[k] for k in npz.files}
+    return None
+
+
+def save_arrays(arrays: dict, name: str, start_year: int = None, end_year: int = None) -> str:
+    os.makedirs(_CACHE_DIR, exist_ok=True)
+    path = _array_path(name, start_year, end_year)
+    np.savez(path, **arrays)
+    return path
+
+
 def clear(name: str, start_year: int, end_year: int) -> bool:
     path = _path(name, start_year, end_year)
     if os.path.exists(path):
         os.remove(path)
         return True
     return False
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 hex digest of a file's contents, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_stat(path: str) -> dict:
+    """Size and mtime of *path*, for is_current()."""
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def is_current(meta: dict, path: str) -> bool:
+    """True if *meta* (source_stat() plus 'sha256') still describes *path*.
+
+    Size and mtime are checked first; if only the mtime moved, the content
+    hash decides and meta['mtime_ns'] is refreshed in place.
+    """
+    stat = source_stat(path)
+    if meta.get('size') != stat['size']:
+        return False
+    if meta.get('mtime_ns') == stat['mtime_ns']:
+        return True
+    if meta.get('sha256') != file_digest(path):
+        return False
+    meta.update(stat)
+    return True
@@ -0,0 +1,16 @@
+"""
+Column layout of the wide station DataFrames passed between steps 0-2.
+
+One row per station (index Station_ID): a '{month}_{year}' column per
+month, followed by the metadata columns below.
+"""
+
+import pandas as pd
+
+# Non-temperature columns, in the order step0 writes them
+STATION_META_COLS = ('Latitude', 'Longitude', '__LastGHCNYear__')
+
+
+def time_cols(df: pd.DataFrame) -> list:
+    """The '{month}_{year}' temperature columns of *df*, in frame order."""
+    return [c for c in df.columns if c not in STATION_META_COLS]
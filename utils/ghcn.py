@@ -0,0 +1,430 @@
+"""
+Vectorised reader for the GHCN-Monthly temperature file (ghcnm.tavg.qcf.dat).
+
+File layout (one record per line, every line the same length)
+-----------
+  cols  0-10  : Station_ID (11 chars)
+  cols 11-14  : Year       (4 chars)
+  cols 15-18  : Element    (4 chars, always TAVG for this file)
+  then 12 groups of 8 chars each:
+    cols 19+8k .. 23+8k : monthly value in 0.01 °C (-9999 = missing)
+    cols 24+8k .. 26+8k : flags (ignored)
+
+The file is memory-mapped and viewed as an (n_records, record_len) uint8
+array, so every field is a column slice and decoding is plain integer
+arithmetic over whole columns — no per-line Python objects. A year range is
+pushed down to the scan: the 4-byte year field is compared as a big-endian
+integer (ASCII digits sort like the numbers they spell), and only records in
+range are decoded. A .gz/.xz file is streamed through its decompressor in
+fixed-size chunks of records instead.
+
+Station × year × month cube
+---------------------------
+open_cube() converts the file once into a binary cube stored next to it
+(<file>.cube/): raw 0.01 °C values (n_stations, n_years, 12) as int16, or
+int32 when some value does not fit int16 (the 5-character field holds up
+to 99999), a per-(station, year) record-present mask, the sorted station
+IDs and each station's last year. The arrays are .npy files opened with mmap_mode='r', so
+a year window is a slice of the mapping rather than a re-parse. The cube is
+rebuilt when the source file's size changes, or its mtime changes and its
+SHA-256 no longer matches, or was written by an older cube format.
+
+With workers > 1 the cube is built in parallel: the file is split into byte
+ranges that end on line boundaries, each range is decoded in a worker
+process, and the workers write straight into cube arrays held in
+multiprocessing.shared_memory (no DataFrames or decoded arrays are pickled).
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+from utils import inputs, parallel
+from utils.cache import file_digest, is_current, source_stat
+
+MISSING = -9999
+
+_ID_WIDTH   = 11
+_YEAR_COLS  = (11, 15)
+_VALUE_COLS = [(19 + 8 * k, 24 + 8 * k) for k in range(12)]
+_MIN_LEN    = _VALUE_COLS[-1][1]
+
+CHUNK_RECORDS = 1 << 16     # lines decoded per chunk (bounds temporaries)
+
+_SPACE, _MINUS, _ZERO, _NINE = ord(' '), ord('-'), ord('0'), ord('9')
+
+
+def _records(raw):
+    """View the uint8 buffer *raw* as (n_records, record_len), newline included.
+
+    Returns None when the lines are not all the same length (the caller then
+    falls back to a line-oriented parser).
+    """
+    if raw.size == 0:
+        return np.empty((0, _MIN_LEN + 1), dtype=np.uint8)
+    if raw[-1] != ord('\n'):
+        raw = np.append(raw, np.uint8(ord('\n')))
+    record_len = int(np.argmax(raw == ord('\n'))) + 1
+    if record_len <= _MIN_LEN or raw.size % record_len:
+        return None
+    rec = raw.reshape(-1, record_len)
+    if not np.all(rec[:, -1] == ord('\n')):
+        return None
+    return rec
+
+
+def _decode_int(field):
+    """Decode right-aligned decimal fields, shape (..., width) uint8 → int32.
+
+    Blank fields decode to MISSING. Returns None if any byte is not a
+    digit, space or minus sign.
+    """
+    digit = (field >= _ZERO) & (field <= _NINE)
+    if not np.all(digit | (field == _SPACE) | (field == _MINUS)):
+        return None
+    out = np.zeros(field.shape[:-1], dtype=np.int32)
+    for k in range(field.shape[-1]):
+        d = digit[..., k]
+        out = np.where(d, out * 10 + (field[..., k].astype(np.int32) - _ZERO), out)
+    out = np.where((field == _MINUS).any(axis=-1), -out, out)
+    return np.where(digit.any(axis=-1), out, MISSING)
+
+
+def _year_key(year):
+    """Big-endian uint32 of the 4-char ASCII year, clamped to 0000-9999."""
+    return int.from_bytes(b'%04d' % min(max(year, 0), 9999), 'big')
+
+
+def select(rec, start_year=None, end_year=None):
+    """Return the records whose year lies in [start_year, end_year].
+
+    Works on the raw year bytes, so rows outside the range are never decoded.
+    """
+    if start_year is None and end_year is None:
+        return rec
+    key = np.ascontiguousarray(rec[:, _YEAR_COLS[0]:_YEAR_COLS[1]]).view('>u4').ravel()
+    keep = np.ones(len(rec), dtype=bool)
+    if start_year is not None:
+        keep &= key >= _year_key(start_year)
+    if end_year is not None:
+        keep &= key <= _year_key(end_year)
+    return rec[keep]
+
+
+def decode(rec):
+    """Decode a record array from _records() / select().
+
+    Returns (ids, years, values) or None if a field is malformed:
+      ids    : (n,) bytes 'S11'
+      years  : (n,) int32
+      values : (n, 12) int32, 0.01 °C, MISSING for missing months
+    """
+    years = _decode_int(rec[:, _YEAR_COLS[0]:_YEAR_COLS[1]])
+    fields = np.stack([rec[:, a:b] for a, b in _VALUE_COLS], axis=1)   # (n, 12, 5)
+    values = _decode_int(fields)
+    if years is None or values is None:
+        return None
+    ids = np.ascontiguousarray(rec[:, :_ID_WIDTH]).view(f'S{_ID_WIDTH}').ravel()
+    return ids, years, values
+
+
+def _map(path, start=0, end=None):
+    """Memory-map bytes [start, end) of *path* as uint8."""
+    if end is None:
+        end = os.path.getsize(path)
+    if end <= start:
+        return np.empty(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='r', offset=start, shape=(end - start,))
+
+
+def scan(path, start_year=None, end_year=None, chunk_records=CHUNK_RECORDS):
+    """Yield the records of *path* with year in [start_year, end_year], in
+    chunks of at most *chunk_records* lines.
+
+    Plain files are memory-mapped; .gz/.xz files are streamed through the
+    decompressor, holding one chunk at a time. Raises ValueError if the file
+    is not strictly fixed-width.
+    """
+    if not inputs.is_compressed(path):
+        rec = _records(_map(path))
+        if rec is None:
+            raise ValueError(f"{path}: lines are not all the same length")
+        for i in range(0, max(len(rec), 1), chunk_records):
+            yield select(rec[i:i + chunk_records], start_year, end_year)
+        return
+
+    with inputs.open_binary(path) as f:
+        head = f.readline()
+        record_len = len(head)
+        buf = head + f.read(record_len * (chunk_records - 1))
+        while buf:
+            rec = _records(np.frombuffer(buf, dtype=np.uint8))
+            if rec is None or rec.shape[1] != record_len:
+                raise ValueError(f"{path}: lines are not all the same length")
+            yield select(rec, start_year, end_year)
+            buf = f.read(record_len * chunk_records)
+
+
+def read(path, start_year=None, end_year=None):
+    """Read and decode the records of a GHCN-Monthly file with year in
+    [start_year, end_year] (either bound may be None).
+
+    Returns decode()'s tuple, or None if the file is not strictly fixed-width.
+    """
+    parts = []
+    try:
+        for rec in scan(path, start_year, end_year):
+            parsed = decode(rec)
+            if parsed is None:
+                return None
+            parts.append(parsed)
+    except ValueError:
+        return None
+    if not parts:
+        return decode(np.empty((0, _MIN_LEN + 1), dtype=np.uint8))
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+# ── Per-record content hashes (incremental ingest) ───────────────────────────
+
+_FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+_FNV_PRIME  = np.uint64(0x100000001b3)
+
+
+def keys(rec):
+    """(n,) 'S15' record keys: Station_ID followed by Year, as in the file."""
+    return np.ascontiguousarray(rec[:, :_YEAR_COLS[1]]).view(f'S{_YEAR_COLS[1]}').ravel()
+
+
+def split_keys(key_array):
+    """Split keys() output back into (ids 'S11', years int32)."""
+    raw = np.ascontiguousarray(key_array).view(np.uint8).reshape(-1, _YEAR_COLS[1])
+    years = _decode_int(raw[:, _YEAR_COLS[0]:_YEAR_COLS[1]])
+    return key_array.astype(f'S{_ID_WIDTH}'), years
+
+
+def content_hash(rec):
+    """(n,) uint64 FNV-1a hash of each record's twelve value fields.
+
+    Flags are left out, so a flag-only revision does not count as a change.
+    """
+    h = np.full(len(rec), _FNV_OFFSET, dtype=np.uint64)
+    for a, b in _VALUE_COLS:
+        for col in range(a, b):
+            h ^= rec[:, col]
+            h *= _FNV_PRIME
+    return h
+
+
+# ── Station × year × month cube ──────────────────────────────────────────────
+
+_CUBE_ARRAYS = ('ids', 'values', 'present', 'last_year')
+_CUBE_DTYPES = (np.int16, np.int32)     # narrowest that holds every value wins
+_CUBE_FORMAT = 2                        # bumped when cube contents change meaning
+
+
+def _fits(values, dtype):
+    """True if every element of the int array *values* fits *dtype*."""
+    if values.size == 0:
+        return True
+    info = np.iinfo(dtype)
+    return info.min <= int(values.min()) and int(values.max()) <= info.max
+
+
+class Cube:
+    """Memory-mapped station × year × month view of a GHCN file."""
+    __slots__ = ('ids', 'values', 'present', 'last_year', 'first_year')
+
+    def __init__(self, ids, values, present, last_year, first_year):
+        self.ids = ids                  # (ns,) 'S11', sorted
+        self.values = values            # (ns, ny, 12) int16/int32, MISSING if absent
+        self.present = present          # (ns, ny) bool, record in file
+        self.last_year = last_year      # (ns,) int32
+        self.first_year = first_year
+
+    def window(self, start_year, end_year):
+        """Return (years, values, present) for [start_year, end_year].
+
+        *values* and *present* are slices of the mapped arrays (no copy).
+        """
+        n_years = self.present.shape[1]
+        y0 = min(max(start_year - self.first_year, 0), n_years)
+        y1 = min(max(end_year - self.first_year + 1, y0), n_years)
+        years = np.arange(self.first_year + y0, self.first_year + y1)
+        return years, self.values[:, y0:y1], self.present[:, y0:y1]
+
+
+def to_cube(ids, years, values):
+    """Scatter decode()'d records into in-memory cube arrays."""
+    uniq, row = np.unique(ids, return_inverse=True)
+    if len(years):
+        first_year, last = int(years.min()), int(years.max())
+    else:
+        first_year, last = 0, -1
+    col = years - first_year
+
+    dtype = next(dtype for dtype in _CUBE_DTYPES if _fits(values, dtype))
+    cube_values = np.full((len(uniq), last - first_year + 1, 12), MISSING, dtype=dtype)
+    present = np.zeros(cube_values.shape[:2], dtype=bool)
+    cube_values[row, col] = values
+    present[row, col] = True
+
+    last_year = np.full(len(uniq), first_year - 1, dtype=np.int32)
+    np.maximum.at(last_year, row, years.astype(np.int32))
+    return Cube(uniq, cube_values, present, last_year, first_year)
+
+
+# ── Parallel cube build ───────────────────────────────────────────────────────
+
+def _split(path, n_parts):
+    """Split *path* into at most *n_parts* byte ranges ending on line boundaries."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for k in range(1, n_parts):
+            f.seek(max(k * size // n_parts - 1, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def _scan_range(path, start, end):
+    """Worker: (record_len, unique station IDs, min year, max year) of a range."""
+    rec = _records(_map(path, start, end))
+    if rec is None:
+        return None
+    years = _decode_int(rec[:, _YEAR_COLS[0]:_YEAR_COLS[1]])
+    if years is None:
+        return None
+    ids = np.ascontiguousarray(rec[:, :_ID_WIDTH]).view(f'S{_ID_WIDTH}').ravel()
+    if len(years) == 0:
+        return rec.shape[1], ids, None, None
+    return rec.shape[1], np.unique(ids), int(years.min()), int(years.max())
+
+
+def _fill_range(path, start, end, ids, first_year, values_spec, present_spec):
+    """Worker: decode a range and scatter it into the shared cube arrays.
+
+    Returns True when written, None if the range is malformed, and False
+    (writing nothing) if a value does not fit the shared values' dtype.
+    """
+    rec = _records(_map(path, start, end))
+    parsed = None if rec is None else decode(rec)
+    if parsed is None:
+        return None
+    rec_ids, years, values = parsed
+    if not _fits(values, values_spec[2]):
+        return False
+    row = np.searchsorted(ids, rec_ids)
+    col = years - first_year
+    shm_v, cube_values = parallel.attach(values_spec)
+    shm_p, present = parallel.attach(present_spec)
+    try:
+        cube_values[row, col] = values
+        present[row, col] = True
+    finally:
+        del cube_values, present
+        shm_v.close()
+        shm_p.close()
+    return True
+
+
+def build_cube(path, workers=1):
+    """Parse *path* into an in-memory Cube, using *workers* processes.
+
+    Returns None if the file is not strictly fixed-width.
+    """
+    if workers <= 1:
+        parsed = read(path)
+        return None if parsed is None else to_cube(*parsed)
+
+    ranges = _split(path, workers)
+    with parallel.pool(workers) as pool:
+        scans = list(pool.map(_scan_range, *zip(*[(path, a, b) for a, b in ranges])))
+        if any(scan is None for scan in scans) or len({scan[0] for scan in scans}) > 1:
+            return None
+        spans = [scan for scan in scans if scan[2] is not None]
+        if not spans:
+            return build_cube(path, workers=1)
+
+        ids = np.unique(np.concatenate([scan[1] for scan in spans]))
+        first_year = min(scan[2] for scan in spans)
+        n_years = max(scan[3] for scan in spans) - first_year + 1
+
+        # A range holding a value too wide for int16 sends the whole fill
+        # round again with int32 values.
+        for dtype in _CUBE_DTYPES:
+            with parallel.SharedArray((len(ids), n_years, 12), dtype, fill=MISSING) as sv, \
+                 parallel.SharedArray((len(ids), n_years), bool, fill=False) as sp:
+                jobs = [pool.submit(_fill_range, path, a, b, ids, first_year, sv.spec, sp.spec)
+                        for a, b in ranges]
+                results = [job.result() for job in jobs]
+                if None in results:
+                    return None
+                if all(results):
+                    cube_values = sv.array.copy()
+                    present = sp.array.copy()
+                    break
+
+    has = present[:, ::-1]
+    last_year = (first_year + n_years - 1 - np.argmax(has, axis=1)).astype(np.int32)
+    return Cube(ids, cube_values, present, last_year, first_year)
+
+
+def _cube_dir(path):
+    return path + '.cube'
+
+
+def _load_cube(cube_dir):
+    with open(os.path.join(cube_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    arrays = {name: np.load(os.path.join(cube_dir, f'{name}.npy'), mmap_mode='r')
+              for name in _CUBE_ARRAYS}
+    return Cube(first_year=meta['first_year'], **arrays)
+
+
+def _save_cube(cube, cube_dir, source_meta):
+    tmp_dir = cube_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name in _CUBE_ARRAYS:
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), getattr(cube, name))
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(dict(source_meta, first_year=cube.first_year, format=_CUBE_FORMAT), f)
+    shutil.rmtree(cube_dir, ignore_errors=True)
+    os.replace(tmp_dir, cube_dir)
+
+
+def _cube_is_current(cube_dir, path):
+    """True if the cube at *cube_dir* was built from the current *path*
+    (see cache.is_current(); a refreshed mtime is written back)."""
+    meta_path = os.path.join(cube_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    mtime_ns = meta.get('mtime_ns')
+    if meta.get('format') != _CUBE_FORMAT or not is_current(meta, path):
+        return False
+    if meta['mtime_ns'] != mtime_ns:
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+    return True
+
+
+def open_cube(path, workers=1):
+    """Open the cube for the GHCN file at *path*, (re)building it if stale.
+
+    Returns None if the file is not strictly fixed-width.
+    """
+    cube_dir = _cube_dir(path)
+    if not _cube_is_current(cube_dir, path):
+        cube = build_cube(path, workers)
+        if cube is None:
+            return None
+        source_meta = dict(source_stat(path), sha256=file_digest(path))
+        _save_cube(cube, cube_dir, source_meta)
+    return _load_cube(cube_dir)
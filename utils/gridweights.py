@@ -0,0 +1,167 @@
+"""
+Station → subbox gridding weights for step3, as a sparse matrix.
+
+For each of the 8000 equal-area subboxes (eqarea.gridsub() order) the
+matrix lists the stations within the gridding radius of the subbox centre,
+in ascending station order, with the cosine of their angular distance and
+their distance weight 1 - chord/arc (chord on the unit sphere). It is held
+in CSR form, shape (8000, n_stations): row k's stations are
+indices[indptr[k]:indptr[k + 1]], with cosd and weights alongside.
+
+Only station locations and the radius enter it, so for the inventory the
+matrix is built once per (v4.inv SHA-256, radius) and kept in
+cache/subbox_weights_<radius>.npz. The distance test and weights are
+exactly those of step3's original per-subbox scan over all stations.
+"""
+
+import math
+
+import numpy as np
+
+from utils import cache, eqarea, spatial
+from utils.logger import logger
+
+EARTH_RADIUS = 6375.0       # km, matches gistemp4.0/steps/earth.py
+POLAR_LATITUDE = 84         # subboxes whose centre rounds to >= this are the pole
+
+
+def subboxes():
+    """The 8000 subboxes (lat_s, lat_n, lon_w, lon_e) in eqarea.gridsub() order."""
+    return [subbox for _box, subbox_gen in eqarea.gridsub() for subbox in subbox_gen]
+
+
+def centres(boxes=None):
+    """(4, n) snlat, cslat, snlon, cslon of the centres of *boxes* (default:
+    all subboxes). Polar subboxes are all treated as the pole itself, as in
+    gistemp4.0."""
+    pi180 = math.pi / 180.0
+    out = []
+    for subbox in subboxes() if boxes is None else boxes:
+        clat, clon = eqarea.centre(subbox)
+        if round(clat) >= POLAR_LATITUDE:
+            clat, clon = 90.0, 0.0
+        elif round(clat) <= -POLAR_LATITUDE:
+            clat, clon = -90.0, 0.0
+        out.append((math.sin(clat * pi180), math.cos(clat * pi180),
+                    math.sin(clon * pi180), math.cos(clon * pi180)))
+    return np.array(out, dtype=np.float64).reshape(-1, 4).T
+
+
+def distance_weights(cosd, radius):
+    """1 - chord/arc for stations at cosine of angular distance *cosd*."""
+    chord = np.sqrt(np.maximum(2.0 * (1.0 - cosd), 0.0))
+    return 1.0 - chord / (radius / EARTH_RADIUS)
+
+
+class SubboxWeights:
+    """CSR station → subbox weights, shape (n_subboxes, n_stations).
+
+    *ids* (the stations' IDs, when built from an inventory) enables the
+    by-ID queries stations() and subboxes().
+    """
+    __slots__ = ('radius', 'n_stations', 'indptr', 'indices', 'cosd', 'weights',
+                 'ids', 'sha256')
+
+    def __init__(self, radius, n_stations, indptr, indices, cosd, weights=None,
+                 ids=None, sha256=None):
+        self.radius = float(radius)
+        self.n_stations = int(n_stations)
+        self.indptr, self.indices, self.cosd = indptr, indices, cosd
+        self.weights = distance_weights(cosd, radius) if weights is None else weights
+        self.ids, self.sha256 = ids, sha256
+
+    @property
+    def shape(self):
+        return len(self.indptr) - 1, self.n_stations
+
+    def _entry_rows(self):
+        """Subbox number of every stored entry."""
+        return np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+
+    def row(self, subbox):
+        """(stations, weights) of subbox number *subbox*, stations ascending."""
+        lo, hi = self.indptr[subbox], self.indptr[subbox + 1]
+        return self.indices[lo:hi], self.weights[lo:hi]
+
+    def stations(self, subbox):
+        """IDs of the stations within the radius of subbox number *subbox*."""
+        return self.ids[self.row(subbox)[0]].astype(str)
+
+    def subboxes(self, station_id):
+        """(subboxes, weights): the subboxes station *station_id* is within
+        the radius of, i.e. can feed, ascending, and its weight in each."""
+        pos = np.flatnonzero(self.ids == np.bytes_(station_id))
+        entries = np.flatnonzero(np.isin(self.indices, pos))
+        return self._entry_rows()[entries], self.weights[entries]
+
+    def within(self, radius):
+        """The matrix for a radius no larger than this one's, cut from the
+        stored distances instead of computing them again."""
+        if radius > self.radius:
+            raise ValueError(f"radius {radius:g} km exceeds the matrix's {self.radius:g} km")
+        keep = self.cosd > math.cos(radius / EARTH_RADIUS)
+        indptr = np.zeros_like(self.indptr)
+        indptr[1:] = np.cumsum(np.bincount(self._entry_rows()[keep], minlength=self.shape[0]))
+        return SubboxWeights(radius, self.n_stations, indptr, self.indices[keep],
+                             self.cosd[keep], ids=self.ids, sha256=self.sha256)
+
+    def select(self, columns):
+        """CSR (indptr, positions, weights) over the stations *columns*
+        instead: entries are renumbered to their station's position in
+        *columns* and ascend within each row. Stations not in *columns*
+        drop out, as do columns of -1 (no such station)."""
+        rank = np.full(self.n_stations, -1, dtype=np.int64)
+        found = np.flatnonzero(columns >= 0)
+        rank[columns[found]] = found
+        pos = rank[self.indices]
+        keep = pos >= 0
+        rows, pos, weights = self._entry_rows()[keep], pos[keep], self.weights[keep]
+        order = np.lexsort((pos, rows))
+        indptr = np.zeros_like(self.indptr)
+        indptr[1:] = np.cumsum(np.bincount(rows, minlength=self.shape[0]))
+        return indptr, pos[order], weights[order]
+
+
+def build(snlat, cslat, snlon, cslon, radius, boxes=None):
+    """SubboxWeights over stations at the given positions (NaN: never within).
+
+    Each row holds the stations with cosd > cos(arc), cosd computed with
+    the expression of spatial.CapIndex (and of step3's original scan).
+    """
+    index = spatial.CapIndex(snlat, cslat, snlon, cslon)
+    arc = radius / EARTH_RADIUS
+    rows, dists = [], []
+    for c in centres(boxes).T.tolist():
+        idx, cosd = index.query(*c, arc)
+        rows.append(idx)
+        dists.append(cosd)
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(r) for r in rows])
+    indices = np.concatenate(rows).astype(np.int64) if rows else np.empty(0, dtype=np.int64)
+    cosd = np.concatenate(dists) if dists else np.empty(0)
+    return SubboxWeights(radius, len(index), indptr, indices, cosd)
+
+
+def _cache_name(radius):
+    return f'subbox_weights_{radius:g}'
+
+
+def load(inv, radius) -> SubboxWeights:
+    """SubboxWeights over the inventory *inv*'s stations, from the cache if
+    built from the same inventory (SHA-256) and radius."""
+    name = _cache_name(radius)
+    arrays = cache.load_arrays(name)
+    if (arrays is not None and inv.sha256 is not None
+            and str(arrays['inv_sha256']) == inv.sha256
+            and float(arrays['radius']) == float(radius)):
+        return SubboxWeights(radius, len(inv), arrays['indptr'], arrays['indices'],
+                             arrays['cosd'], arrays['weights'], ids=inv.ids, sha256=inv.sha256)
+
+    logger.info(f"  Building subbox weights for {len(inv)} stations, radius {radius:g} km…")
+    sw = build(inv.snlat, inv.cslat, inv.snlon, inv.cslon, radius)
+    sw.ids, sw.sha256 = inv.ids, inv.sha256
+    if inv.sha256 is not None:
+        cache.save_arrays({'indptr': sw.indptr, 'indices': sw.indices, 'cosd': sw.cosd,
+                           'weights': sw.weights, 'radius': np.array(float(radius)),
+                           'inv_sha256': np.array(inv.sha256)}, name)
+    return sw
@@ -0,0 +1,44 @@
+"""
+Access to input files that may be kept gzip- or xz-compressed in input/.
+
+resolve('input/foo') returns the first of input/foo, input/foo.gz and
+input/foo.xz that exists, so callers keep using the uncompressed name.
+Compressed files are read through a streaming decompressor; nothing is
+decompressed to disk.
+"""
+
+import gzip
+import io
+import lzma
+import os
+
+COMPRESSED_SUFFIXES = ('.gz', '.xz')
+
+
+def resolve(path: str):
+    """Return *path* or its .gz/.xz sibling, whichever exists first; else None."""
+    for candidate in (path,) + tuple(path + s for s in COMPRESSED_SUFFIXES):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def is_compressed(path: str) -> bool:
+    return path.endswith(COMPRESSED_SUFFIXES)
+
+
+def open_binary(path: str):
+    """Open *path* (or its compressed sibling) for streaming binary reads."""
+    resolved = resolve(path)
+    if resolved is None:
+        raise FileNotFoundError(path)
+    if resolved.endswith('.gz'):
+        return gzip.open(resolved, 'rb')
+    if resolved.endswith('.xz'):
+        return lzma.open(resolved, 'rb')
+    return open(resolved, 'rb')
+
+
+def open_text(path: str):
+    """Text-mode counterpart of open_binary()."""
+    return io.TextIOWrapper(open_binary(path))
@@ -0,0 +1,137 @@
+"""
+Station inventory (v4.inv) as compact arrays, shared by steps 0, 2 and 3.
+
+File layout (fixed width, one station per line)
+-----------
+  cols  0-10  : Station_ID
+  cols 11-19  : Latitude  (degrees)
+  cols 20-29  : Longitude (degrees)
+  cols 30-36  : Elevation (m)
+  then state code and name (ignored)
+
+The file is parsed once into an Inventory: station IDs, lat/lon/elevation
+and the sines and cosines of lat/lon that the distance calculations in
+step2 and step3 use. The arrays are saved next to the file (<file>.npz)
+together with the file's SHA-256, and reloaded from there until the file
+changes.
+"""
+
+import math
+import os
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+from utils import inputs
+from utils.cache import file_digest
+from utils.config import INPUT_DIR
+from utils.logger import logger
+
+_ARRAYS = ('ids', 'lat', 'lon', 'elev', 'snlat', 'cslat', 'snlon', 'cslon')
+
+
+class Inventory:
+    """Per-station arrays in file order; ids are 'S11'. sha256 is the
+    source file's digest when loaded through load()."""
+    __slots__ = _ARRAYS + ('sha256', '_order')
+
+    def __init__(self, ids, lat, lon, elev, snlat, cslat, snlon, cslon, sha256=None):
+        self.sha256 = sha256
+        self.ids = ids
+        self.lat, self.lon, self.elev = lat, lon, elev
+        self.snlat, self.cslat = snlat, cslat
+        self.snlon, self.cslon = snlon, cslon
+        self._order = np.argsort(ids, kind='stable')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def locate(self, station_ids):
+        """Positions of *station_ids* in the inventory; -1 where absent."""
+        keys = np.asarray(station_ids, dtype='S11')
+        if not len(self.ids):
+            return np.full(len(keys), -1, dtype=np.intp)
+        sorted_ids = self.ids[self._order]
+        pos = np.minimum(np.searchsorted(sorted_ids, keys), len(sorted_ids) - 1)
+        return np.where(sorted_ids[pos] == keys, self._order[pos], -1)
+
+    def trig(self, station_ids):
+        """(snlat, cslat, snlon, cslon) for *station_ids*; NaN where absent."""
+        pos = self.locate(station_ids)
+        found = pos >= 0
+        out = []
+        for name in ('snlat', 'cslat', 'snlon', 'cslon'):
+            values = np.full(len(pos), np.nan)
+            values[found] = getattr(self, name)[pos[found]]
+            out.append(values)
+        return tuple(out)
+
+    def frame(self) -> pd.DataFrame:
+        """Station_ID / Latitude / Longitude columns, in file order."""
+        return pd.DataFrame({'Station_ID': self.ids.astype(str),
+                             'Latitude': self.lat, 'Longitude': self.lon})
+
+
+def _float(field: str) -> float:
+    try:
+        return float(field)
+    except ValueError:
+        return math.nan
+
+
+def parse(path: str) -> Inventory:
+    """Parse an inventory file (plain or .gz/.xz) into an Inventory."""
+    ids, lat, lon, elev = [], [], [], []
+    with inputs.open_text(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            ids.append(line[0:11].strip())
+            lat.append(_float(line[11:20]))
+            lon.append(_float(line[20:30]))
+            elev.append(_float(line[30:37]))
+    pi180 = math.pi / 180.0
+    # math.sin/cos per station, as the per-station code in step2 computed them
+    return Inventory(
+        ids=np.array(ids, dtype='S11'),
+        lat=np.array(lat), lon=np.array(lon), elev=np.array(elev),
+        snlat=np.array([math.sin(v * pi180) for v in lat]),
+        cslat=np.array([math.cos(v * pi180) for v in lat]),
+        snlon=np.array([math.sin(v * pi180) for v in lon]),
+        cslon=np.array([math.cos(v * pi180) for v in lon]),
+    )
+
+
+def _sidecar(path):
+    return path + '.npz'
+
+
+def load(path: str) -> Inventory:
+    """Inventory for the file at *path*, from its sidecar if still current."""
+    path = inputs.resolve(path) or path
+    digest = file_digest(path)
+    sidecar = _sidecar(path)
+    if os.path.exists(sidecar):
+        with np.load(sidecar) as npz:
+            if str(npz['sha256']) == digest:
+                return Inventory(sha256=digest, **{name: npz[name] for name in _ARRAYS})
+    inv = parse(path)
+    inv.sha256 = digest
+    tmp = sidecar + '.tmp.npz'
+    np.savez(tmp, sha256=np.array(digest),
+             **{name: getattr(inv, name) for name in _ARRAYS})
+    os.replace(tmp, sidecar)
+    return inv
+
+
+def fetch(url: str) -> Inventory:
+    """Download v4.inv to input/ if needed and return its Inventory."""
+    local_path = os.path.join(INPUT_DIR, 'v4.inv')
+    if inputs.resolve(local_path) is None:
+        logger.info("Downloading GHCN metadata...")
+        os.makedirs(INPUT_DIR, exist_ok=True)
+        urllib.request.urlretrieve(url, local_path)
+    else:
+        logger.info("  GHCN metadata: using cached file.")
+    return load(local_path)
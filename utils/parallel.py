@@ -0,0 +1,65 @@
+"""
+Process-pool and shared-memory helpers for the parallel code paths.
+
+Large arrays are handed to worker processes through
+multiprocessing.shared_memory rather than pickled: the parent creates a
+SharedArray, passes its picklable .spec to the workers, and each worker
+attach()es to it to read or write in place.
+"""
+
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+class SharedArray:
+    """A NumPy array backed by a named shared-memory segment (parent side)."""
+    __slots__ = ('shm', 'array', 'spec')
+
+    def __init__(self, shape, dtype, fill=None):
+        shape = tuple(int(n) for n in shape)
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+        self.spec = (self.shm.name, shape, dtype.str)
+        if fill is not None:
+            self.array[...] = fill
+
+    def release(self):
+        """Drop the array view, then close and unlink the segment."""
+        self.array = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def attach(spec):
+    """Worker side: return (shm, array) for a SharedArray.spec.
+
+    Close *shm* (after dropping *array*) when done; never unlink it.
+    """
+    name, shape, dtype = spec
+    if sys.version_info >= (3, 13):
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def pool(workers):
+    """ProcessPoolExecutor for *workers* processes.
+
+    The resource tracker is started first so that the workers share it;
+    otherwise each worker's own tracker "cleans up" the parent's segments
+    when it exits.
+    """
+    resource_tracker.ensure_running()
+    return ProcessPoolExecutor(max_workers=workers)
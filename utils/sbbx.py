@@ -17,6 +17,8 @@ Ocean subboxes have cur_mo1 = monm (full series).
 Land placeholder subboxes have cur_mo1 = 1 (single MISSING value).
 
 MISSING sentinel: 9999.0 → NaN on read.
+
+A gzip/xz-compressed copy (path + '.gz' / '.xz') is streamed directly.
 """
 
 import math
@@ -25,6 +27,8 @@ import struct
 import numpy as np
 import pandas as pd
 
+from utils import inputs
+
 _BOS     = '>'       # big-endian (all SBBX files)
 _MISSING = 9999.0
 
@@ -53,7 +57,7 @@ def read(path, start_year, end_year):
                  for m in range(1, 13)]
     n_out = len(time_cols)
 
-    with open(path, 'rb') as f:
+    with inputs.open_binary(path) as f:
         # ── Header ──────────────────────────────────────────────────
         hdr = _read_record(f)
         (mo1, kq, mavg, monm, monm4, yrbeg,
@@ -0,0 +1,63 @@
+"""
+Spherical-cap queries over a fixed set of stations.
+
+Points are given by the sines and cosines of their latitude and longitude
+(as held by utils/inventory.py). A query returns every point whose cosine
+of angular distance to the query point,
+
+    snlat * q_snlat + cslat * q_cslat * (cslon * q_cslon + snlon * q_snlon),
+
+exceeds cos(arc), in ascending point order, computed with exactly that
+expression, so results match a brute-force scan over all points bit for
+bit.
+
+The index keeps the points sorted by sin(latitude). A cap of angular radius
+arc only reaches latitudes within arc of the query's, so a query evaluates
+the exact test only on the slice of that latitude band (widened by a small
+margin so no boundary point is missed).
+"""
+
+import math
+
+import numpy as np
+
+_MARGIN = 1e-9          # radians added to the band half-width
+
+
+class CapIndex:
+    """Latitude-band index over points given by their lat/lon sines and cosines."""
+    __slots__ = ('snlat', 'cslat', 'snlon', 'cslon', '_order', '_sorted_snlat')
+
+    def __init__(self, snlat, cslat, snlon, cslon):
+        self.snlat = np.asarray(snlat, dtype=np.float64)
+        self.cslat = np.asarray(cslat, dtype=np.float64)
+        self.snlon = np.asarray(snlon, dtype=np.float64)
+        self.cslon = np.asarray(cslon, dtype=np.float64)
+        # NaN positions sort last and fall outside every band
+        self._order = np.argsort(self.snlat, kind='stable')
+        self._sorted_snlat = self.snlat[self._order]
+
+    def __len__(self):
+        return len(self.snlat)
+
+    def band(self, snlat, arc):
+        """Sorted indices of the points within *arc* radians of latitude of a
+        point with sin(latitude) *snlat*: a superset of any cap around it."""
+        if math.isnan(snlat):
+            return np.empty(0, dtype=np.intp)
+        lat = math.asin(max(-1.0, min(1.0, snlat)))
+        half = arc + _MARGIN
+        lo = math.sin(max(lat - half, -math.pi / 2)) - _MARGIN
+        hi = math.sin(min(lat + half, math.pi / 2)) + _MARGIN
+        a = np.searchsorted(self._sorted_snlat, lo, side='left')
+        b = np.searchsorted(self._sorted_snlat, hi, side='right')
+        return np.sort(self._order[a:b])
+
+    def query(self, snlat, cslat, snlon, cslon, arc):
+        """(idx, cosd) of the points within angular distance *arc* (radians):
+        idx ascending, cosd the cosine of each one's distance."""
+        idx = self.band(snlat, arc)
+        cosd = (self.snlat[idx] * snlat
+                + self.cslat[idx] * cslat * (self.cslon[idx] * cslon + self.snlon[idx] * snlon))
+        hit = cosd > math.cos(arc)
+        return idx[hit], cosd[hit]